@@ -1,22 +1,111 @@
+import argparse
+import hashlib
+import json
 import os
-from azure.storage.blob import BlobServiceClient
+from pathlib import Path
+from blob_sink import BlobSink, UPLOAD_WORKERS, hashes_match
+
+LEDGER_FILE = ".sync_ledger.json"
+
+
+def load_ledger(ledger_path):
+    try:
+        with open(ledger_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_ledger(ledger, ledger_path):
+    with open(ledger_path, "w") as f:
+        json.dump(ledger, f, separators=(",", ":"))
 
-def upload_files_to_azure(storage_connection_string, container_name, source_folder):
-    blob_service_client = BlobServiceClient.from_connection_string(storage_connection_string)
-    container_client = blob_service_client.get_container_client(container_name)
 
+def calculate_file_hash(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def scan_local(source_folder, ledger):
+    """Map blob path -> [size, mtime_ns, sha256] for every file under source_folder.
+
+    Files whose size and mtime match the ledger reuse the recorded hash, so an
+    unchanged tree costs one stat() per file and no reads.
+    """
+    local = {}
     for root, _, files in os.walk(source_folder):
         for file in files:
             file_path = os.path.join(root, file)
-            blob_path = os.path.relpath(file_path, source_folder)
+            blob_path = Path(os.path.relpath(file_path, source_folder)).as_posix()
+            stat = os.stat(file_path)
+            known = ledger.get(blob_path)
+            if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                local[blob_path] = known
+            else:
+                local[blob_path] = [stat.st_size, stat.st_mtime_ns, calculate_file_hash(file_path)]
+    return local
+
+
+def is_synced(remote_entry, entry, file_path):
+    if remote_entry and remote_entry.get("sha256"):
+        return remote_entry["sha256"] == entry[2]
+    # Uploaded before the SHA-256 went into metadata: compare its Content-MD5
+    return hashes_match(remote_entry, file_path)
+
+
+def sync_folder(blob_sink, source_folder, ledger_path=LEDGER_FILE, delete=False, full=False):
+    """Upload new or changed files under source_folder; optionally delete vanished ones.
+
+    The container is listed once with metadata and each file's hash compared
+    to the sha256 recorded on its blob. Only blobs this ledger previously
+    synced are ever deleted, so other blobs sharing the container are safe.
+    """
+    ledger = {} if full else load_ledger(ledger_path)
+    local = scan_local(source_folder, ledger)
+    remote = {} if full else blob_sink.list_hashes()
+
+    changed = [blob_path for blob_path, entry in local.items()
+               if not is_synced(remote.get(blob_path), entry, Path(source_folder) / blob_path)]
+    print(f"{len(local)} local files, {len(changed)} to upload")
+
+    results = blob_sink.upload_many(
+        {"name": blob_path, "data": Path(source_folder) / blob_path} for blob_path in changed)
+    failed = {blob_path for blob_path, ok in results.items() if not ok}
+    for blob_path in results:
+        if blob_path not in failed:
+            print(f"Uploaded {blob_path} to container {blob_sink.container_name}")
+
+    if delete:
+        # A failed upload still exists locally, so its remote copy is not stale
+        stale = [blob_path for blob_path in ledger
+                 if blob_path not in local and blob_path not in failed and blob_path in remote]
+        for blob_path in blob_sink.delete_many(stale):
+            print(f"Deleted {blob_path} from container {blob_sink.container_name}")
+
+    # Failed uploads are left out of the ledger so the next run re-hashes and retries them
+    save_ledger({blob_path: entry for blob_path, entry in local.items() if blob_path not in failed}, ledger_path)
+
+
+def upload_files_to_azure(storage_connection_string, container_name, source_folder):
+    with BlobSink(storage_connection_string, container_name) as blob_sink:
+        sync_folder(blob_sink, source_folder, full=True)
 
-            print(f"Uploading {file_path} to {blob_path} in container {container_name}")
-            with open(file_path, "rb") as data:
-                container_client.upload_blob(name=blob_path, data=data, overwrite=True)
 
 if __name__ == "__main__":
     STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
     CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
     SOURCE_FOLDER = "./manifests"
 
-    upload_files_to_azure(STORAGE_CONNECTION_STRING, CONTAINER_NAME, SOURCE_FOLDER)
+    parser = argparse.ArgumentParser(description="Sync a local manifest folder to Azure Blob Storage.")
+    parser.add_argument("--source", default=SOURCE_FOLDER)
+    parser.add_argument("--ledger", default=LEDGER_FILE)
+    parser.add_argument("--full", action="store_true", help="ignore the ledger and re-upload every file")
+    parser.add_argument("--delete", action="store_true", help="delete blobs whose local files are gone")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    args = parser.parse_args()
+
+    with BlobSink(STORAGE_CONNECTION_STRING, CONTAINER_NAME, max_workers=args.workers) as blob_sink:
+        sync_folder(blob_sink, args.source, args.ledger, delete=args.delete, full=args.full)
@@ -1,6 +1,7 @@
 from azure.data.tables import TableServiceClient
 from azure.core.credentials import AzureNamedKeyCredential
 from dotenv import load_dotenv
+from table_state import MAX_BATCH_SIZE
 import os
 
 load_dotenv()
@@ -31,27 +32,32 @@ except Exception as e:
     raise ValueError(f"Error reading app names from file: {e}")
 
 
+partition_key = "Apps"
+
 try:
-    for app_name in app_names:
-            partition_key = "Apps" 
-            row_key = app_name     
-
-            try:
-                existing_entity = table_client.get_entity(partition_key=partition_key, row_key=row_key)
-                print(f"Entity with RowKey '{row_key}' already exists. Skipping insertion.")
-                continue
-            except Exception:
-                pass
-
-            # Construct the new entity
-            entity = {
-                "PartitionKey": partition_key,
-                "RowKey": row_key,
-                "AppID": app_name
-            }
-
-            # Insert the entity
-            table_client.create_entity(entity=entity)
-            print(f"Entity with RowKey '{row_key}' and AppID '{app_name}' inserted successfully.")
+    # One scan for existing keys instead of a get_entity per app
+    existing = {entity["RowKey"] for entity in table_client.query_entities(
+        query_filter="PartitionKey eq @pk", parameters={"pk": partition_key}, select=["RowKey"])}
+
+    new_entities = []
+    for app_name in dict.fromkeys(app_names):
+        row_key = app_name
+        if row_key in existing:
+            print(f"Entity with RowKey '{row_key}' already exists. Skipping insertion.")
+            continue
+
+        # Construct the new entity
+        new_entities.append({
+            "PartitionKey": partition_key,
+            "RowKey": row_key,
+            "AppID": app_name
+        })
+
+    # Insert the entities, up to MAX_BATCH_SIZE per transaction
+    for start in range(0, len(new_entities), MAX_BATCH_SIZE):
+        batch = new_entities[start:start + MAX_BATCH_SIZE]
+        table_client.submit_transaction([("create", entity) for entity in batch])
+        for entity in batch:
+            print(f"Entity with RowKey '{entity['RowKey']}' and AppID '{entity['AppID']}' inserted successfully.")
 except Exception as e:
-    print(f"Error inserting entities: {e}")
\ No newline at end of file
+    print(f"Error inserting entities: {e}")
@@ -0,0 +1,57 @@
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+# Compares the storage formats of download_homebrew.py over the sample manifests:
+# pretty JSON (indent=4, the former default) vs compact JSON vs compact + gzip.
+
+SAMPLES = sorted(Path("homebrew").glob("*/*.json")) + [Path("brave-browser.json")]
+ROUNDS = 2000
+
+
+def pretty(data):
+    return json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+
+
+def compact(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compact_gzip(data):
+    return gzip.compress(compact(data), mtime=0)
+
+
+def timed(func, data):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(data)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    manifests = [json.loads(path.read_bytes()) for path in SAMPLES if path.exists()]
+    if not manifests:
+        print("No sample manifests found; run from the repository root.")
+        sys.exit(1)
+
+    formats = [("pretty (indent=4)", pretty), ("compact", compact), ("compact + gzip", compact_gzip)]
+    baseline = sum(len(pretty(data)) for data in manifests)
+
+    print(f"{len(manifests)} manifests, {ROUNDS} rounds each\n")
+    print(f"{'format':<20}{'bytes':>10}{'vs pretty':>12}{'encode us/manifest':>22}{'read us/manifest':>20}")
+    for label, func in formats:
+        size = sum(len(func(data)) for data in manifests)
+        encode_us = sum(timed(func, data) for data in manifests) / len(manifests)
+        payloads = [func(data) for data in manifests]
+        if func is compact_gzip:
+            read = lambda payload: json.loads(gzip.decompress(payload))
+        else:
+            read = json.loads
+        read_us = sum(timed(read, payload) for payload in payloads) / len(payloads)
+        print(f"{label:<20}{size:>10}{size / baseline:>11.0%}{encode_us:>22.1f}{read_us:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
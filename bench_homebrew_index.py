@@ -0,0 +1,99 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from homebrew_index import CACHE_FOLDER, iter_index
+
+# Peak RSS of loading a Homebrew bulk index in full (json.load, as
+# response.json() would) vs streaming it and keeping only tracked entries.
+# Each mode runs in its own process so peaks don't mask each other.
+# Uses homebrew/.index/cask.json when a bulk run has cached it, otherwise a
+# synthetic index of SYNTHETIC_ENTRIES copies of the sample cask.
+
+SAMPLE = Path("homebrew/cask/firefox.json")
+SYNTHETIC_ENTRIES = 7000
+TRACKED = 15
+FIELDS = ["token", "version", "ruby_source_checksum"]
+
+
+def load_full(path, tokens):
+    with open(path, "rb") as f:
+        entries = json.load(f)
+    return {entry["token"]: entry for entry in entries if entry["token"] in tokens}
+
+
+def load_stream(path, tokens, fields=None):
+    manifests = {}
+    for entry in iter_index(path):
+        if entry["token"] in tokens:
+            manifests[entry["token"]] = {field: entry.get(field) for field in fields} if fields else entry
+    return manifests
+
+
+def run_mode(mode, path, tokens):
+    start = time.perf_counter()
+    if mode == "full":
+        manifests = load_full(path, tokens)
+    elif mode == "stream":
+        manifests = load_stream(path, tokens)
+    elif mode == "stream+fields":
+        manifests = load_stream(path, tokens, FIELDS)
+    else:
+        manifests = {}
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"entries": len(manifests), "seconds": elapsed, "peak_kib": peak}))
+
+
+def synthetic_index(folder):
+    sample = json.loads(SAMPLE.read_text(encoding="utf-8"))
+    path = Path(folder) / "cask.json"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(SYNTHETIC_ENTRIES):
+            f.write("," if i else "")
+            json.dump(dict(sample, token=f"{sample['token']}-{i}"), f, ensure_ascii=False)
+        f.write("]")
+    return path
+
+
+def main():
+    # The --mode/--index/--tokens flags are for the per-mode child processes
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode")
+    parser.add_argument("--index")
+    parser.add_argument("--tokens")
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args.mode, args.index, set(json.loads(args.tokens)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = CACHE_FOLDER / "cask.json"
+        if not path.exists():
+            if not SAMPLE.exists():
+                print("No cached index or sample cask found; run from the repository root.")
+                sys.exit(1)
+            path = synthetic_index(folder)
+        tokens = [entry["token"] for entry in iter_index(path)]
+        tracked = json.dumps(tokens[::max(1, len(tokens) // TRACKED)][:TRACKED])
+
+        print(f"{path}: {path.stat().st_size / 1e6:.1f} MB, {len(tokens)} entries, {TRACKED} tracked\n")
+        print(f"{'mode':<16}{'kept':>6}{'seconds':>10}{'peak RSS MiB':>14}{'over baseline':>15}")
+        baseline = None
+        for mode in ("baseline", "full", "stream", "stream+fields"):
+            output = subprocess.run([sys.executable, __file__, "--mode", mode, "--index", str(path), "--tokens", tracked],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            peak = result["peak_kib"] / 1024
+            baseline = peak if baseline is None else baseline
+            print(f"{mode:<16}{result['entries']:>6}{result['seconds']:>10.2f}{peak:>14.1f}{peak - baseline:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
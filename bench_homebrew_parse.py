@@ -0,0 +1,65 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+# CPU per manifest of download_homebrew.py's fetch path over the samples:
+# the old path decoded the response with response.json() three times and
+# re-encoded it with indent=4; the new one decodes once and stores the
+# original bytes (or, for bulk-index entries, one compact encode).
+
+SAMPLES = sorted(Path("homebrew").glob("*/*.json")) + [Path("brave-browser.json")]
+ROUNDS = 2000
+
+
+def response_json(raw):
+    # What requests' Response.json() does for a UTF-8 body: decode to text, then parse
+    return json.loads(raw.decode("utf-8"))
+
+
+def old_path(raw):
+    response_json(raw).get("ruby_source_checksum")
+    response_json(raw)
+    return json.dumps(response_json(raw), indent=4, ensure_ascii=False).encode("utf-8")
+
+
+def single_parse_raw(raw):
+    json.loads(raw).get("ruby_source_checksum")
+    return raw
+
+
+def single_parse_compact(raw):
+    data = json.loads(raw)
+    data.get("ruby_source_checksum")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def timed(func, raw):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(raw)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    # The API serves compact JSON; re-encode the (pretty) samples to match
+    bodies = [json.dumps(json.loads(path.read_bytes()), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+              for path in SAMPLES if path.exists()]
+    if not bodies:
+        print("No sample manifests found; run from the repository root.")
+        sys.exit(1)
+
+    paths = [("3x response.json + indent=4", old_path), ("1 parse, raw bytes", single_parse_raw),
+             ("1 parse, compact encode", single_parse_compact)]
+    print(f"{len(bodies)} manifests, {ROUNDS} rounds each\n")
+    print(f"{'path':<30}{'us/manifest':>14}{'vs old':>10}{'stored bytes':>14}")
+    baseline = None
+    for label, func in paths:
+        us = sum(timed(func, raw) for raw in bodies) / len(bodies)
+        baseline = baseline or us
+        size = sum(len(func(raw)) for raw in bodies)
+        print(f"{label:<30}{us:>14.1f}{us / baseline:>10.0%}{size:>14}")
+
+
+if __name__ == "__main__":
+    main()
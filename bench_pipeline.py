@@ -0,0 +1,220 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import download_manifest15
+import download_manifest16
+import pipeline
+import table_state
+from blob_sink import UPLOAD_WORKERS
+
+# End-to-end cost of one full winget scan, download_manifest15.main (the last
+# serial per-app loop left in the tree) vs download_manifest16.main (an entry
+# point over pipeline.Pipeline), both running their real code against stubbed
+# I/O: every GitHub request and sink call sleeps for a fixed latency and
+# returns canned data, so only the code paths differ. The serial script lists
+# and downloads every app one at a time and opens a Service Bus client per
+# message; its blob upload is commented out, so it pays for no uploads. The
+# engine downloads only changed apps over a thread pool, uploads them in one
+# upload_many and batches its notifications.
+
+APPS = 120
+CHANGED_EVERY = 4  # one app in four has a new version
+WORKERS = UPLOAD_WORKERS
+LATENCY = {
+    "list": 0.030,          # GitHub contents listing per app
+    "download": 0.020,      # raw manifest download
+    "state_scan": 0.040,    # one projected snapshot page (1000 entities)
+    "state_write": 0.012,   # one batched transaction
+    "blob_upload": 0.025,
+    "bus_send": 0.015,      # one batch
+}
+
+
+def pause(name):
+    time.sleep(LATENCY[name])
+
+
+def sha_for(app_id):
+    return "new" if int(app_id.rsplit("-", 1)[1]) % CHANGED_EVERY == 0 else "old"
+
+
+class StubResponse:
+    def __init__(self, data=None, content=b""):
+        self.status_code = 200
+        self._data = data
+        self.content = content
+        self.text = content.decode()
+        self.links = {}
+
+    def json(self):
+        return self._data
+
+
+def stub_get(url, *args, **kwargs):
+    """GitHub contents listing or raw manifest download, after its latency."""
+    if url.startswith("https://raw.githubusercontent.com/"):
+        pause("download")
+        return StubResponse(content=b"manifest")
+    pause("list")
+    app_path = url.split("/manifests/", 1)[1]
+    app_id = ".".join(app_path.split("/")[1:])
+    return StubResponse([{"name": "1.0", "type": "dir", "sha": sha_for(app_id)}])
+
+
+class StubSession:
+    get = staticmethod(stub_get)
+
+
+class StubState:
+    """TableStateBackend's interface over an in-memory partition."""
+
+    def __init__(self, app_ids, *args):
+        self.app_ids = app_ids
+        self.snapshot = {}
+        self.pending = {}
+
+    def load_snapshot(self, fields=None):
+        for _ in range(0, len(self.app_ids), 1000):
+            pause("state_scan")
+        self.snapshot = {app_id: {"AppID": app_id, "gitsha": "old"} for app_id in self.app_ids}
+        return self.snapshot
+
+    def load_apps(self):
+        return set(self.load_snapshot())
+
+    def get_state(self, app_id):
+        return self.snapshot.get(app_id, {})
+
+    def get_sha(self, app_id):
+        return self.get_state(app_id).get("gitsha")
+
+    def queue_patch(self, app_id, patch):
+        self.pending.setdefault(app_id, {}).update(patch)
+
+    def update_entity(self, app_id, **patch):
+        self.queue_patch(app_id, patch)
+
+    def close(self):
+        for _ in range(0, len(self.pending), 100):
+            pause("state_write")
+
+
+class StubBlobSink:
+    def __init__(self, *args, **kwargs):
+        self.stored = 0
+
+    def upload_many(self, uploads):
+        def upload(item):
+            pause("blob_upload")
+            return item["name"], True
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = dict(pool.map(upload, list(uploads)))
+        self.stored += len(results)
+        return results
+
+    def close(self):
+        pass
+
+
+class StubNotifier:
+    def __init__(self, *args, **kwargs):
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def notify(self, body, application_properties=None, message_id=None, session_id=None):
+        with self.lock:
+            self.messages.append(body)
+        return True
+
+    def close(self):
+        for _ in range(0, len(self.messages), 100):
+            pause("bus_send")
+
+
+class StubQueueSender:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def send_messages(self, message):
+        pause("bus_send")
+        self.messages.append(message)
+
+
+class StubServiceBusClient:
+    """ServiceBusClient.from_connection_string(...).get_queue_sender(...), one send per message."""
+
+    messages = []
+
+    @classmethod
+    def from_connection_string(cls, *args, **kwargs):
+        return cls()
+
+    def get_queue_sender(self, queue_name=None):
+        return StubQueueSender(self.messages)
+
+
+class StubBlobServiceClient:
+    @classmethod
+    def from_connection_string(cls, *args, **kwargs):
+        return cls()
+
+    def get_blob_client(self, container=None, blob=None):
+        return None
+
+
+def run_script(app_ids):
+    StubServiceBusClient.messages = []
+    download_manifest15.requests.get = stub_get
+    download_manifest15.TableStateBackend = lambda *args: StubState(app_ids)
+    download_manifest15.BlobServiceClient = StubBlobServiceClient
+    download_manifest15.ServiceBusClient = StubServiceBusClient
+    download_manifest15.main()
+    return len(StubServiceBusClient.messages)
+
+
+def run_engine(app_ids):
+    notifiers = []
+    download_manifest16.BlobSink = StubBlobSink
+    download_manifest16.STATE_BACKEND = "table"
+    table_state.TableStateBackend = lambda *args: StubState(app_ids)
+    pipeline.make_session = lambda *args: StubSession()
+    pipeline.ServiceBusNotifier = lambda *args, **kwargs: notifiers.append(StubNotifier()) or notifiers[-1]
+    pipeline.SERVICE_BUS_CONNECTION_STRING = "stub"
+    download_manifest16.main()
+    return len(notifiers[0].messages)
+
+
+def main():
+    app_ids = [f"Vendor.App-{i}" for i in range(APPS)]
+    print(f"{APPS} apps, {APPS // CHANGED_EVERY} changed, {WORKERS} workers\n")
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # download_manifest15 writes every manifest under manifests/
+        os.chdir(folder)
+        try:
+            for label, func in (("download_manifest15", run_script), ("download_manifest16", run_engine)):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    announced = func(app_ids)
+                results.append((label, announced, time.perf_counter() - start))
+        finally:
+            os.chdir(cwd)
+    baseline = results[0][2]
+    print(f"{'path':<22}{'announced':>10}{'seconds':>10}{'vs script':>11}")
+    for label, announced, seconds in results:
+        print(f"{label:<22}{announced:>10}{seconds:>10.2f}{seconds / baseline:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
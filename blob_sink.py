@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from dotenv import load_dotenv
+load_dotenv()
+
+try:
+    # The async client needs aiohttp as its transport
+    import aiohttp  # noqa: F401
+    from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+except ImportError:
+    AsyncBlobServiceClient = None
+
+STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
+UPLOAD_WORKERS = int(os.getenv("BLOB_UPLOAD_WORKERS", "8"))
+# A blob batch request carries at most 256 sub-requests.
+MAX_DELETE_BATCH = 256
+
+
+def _read(data):
+    if isinstance(data, Path):
+        return data.read_bytes()
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return data
+
+
+def manifest_tags(app_id, version, git_sha=None):
+    """Blob index tags for a manifest, for find_blobs_by_tags queries.
+
+    Tag values may only hold letters, digits, space and + - . / : = _, so any
+    other character is replaced with "_"; the exact version remains in the
+    blob name (<app path>/<version>/<file>).
+    """
+    tags = {"appId": app_id, "packageVersion": version}
+    if git_sha:
+        tags["gitsha"] = git_sha
+    return {key: re.sub(r"[^A-Za-z0-9 +\-./:=_]", "_", value)[:256] for key, value in tags.items()}
+
+
+def content_hash(data):
+    """SHA-256 hex digest of upload data, as stored in the blob's metadata."""
+    return hashlib.sha256(_read(data)).hexdigest()
+
+
+def hashes_match(properties, data):
+    """True if blob properties (see get_properties/list_hashes) describe `data`.
+
+    Blobs uploaded before the SHA-256 was recorded in metadata still carry the
+    Content-MD5 Azure stored for them, which is compared instead.
+    """
+    if not properties:
+        return False
+    data = _read(data)
+    if properties.get("sha256"):
+        return properties["sha256"] == hashlib.sha256(data).hexdigest()
+    return properties.get("content_md5") == hashlib.md5(data).hexdigest()
+
+
+def _md5_hex(content_settings):
+    md5 = content_settings.content_md5 if content_settings else None
+    return bytes(md5).hex() if md5 else None
+
+
+def _with_hashes(data, git_sha=None, metadata=None, content_settings=None, **kwargs):
+    """Attach Content-MD5 and sha256/gitsha metadata to an upload.
+
+    These let change detection run on blob properties or a listing alone,
+    without downloading the blob.
+    """
+    data = _read(data)
+    metadata = dict(metadata or {})
+    metadata["sha256"] = hashlib.sha256(data).hexdigest()
+    if git_sha:
+        metadata["gitsha"] = git_sha
+    # A copy: callers may share one ContentSettings across concurrent uploads
+    content_settings = ContentSettings(**vars(content_settings)) if content_settings else ContentSettings()
+    content_settings.content_md5 = bytearray(hashlib.md5(data).digest())
+    return data, dict(kwargs, metadata=metadata, content_settings=content_settings)
+
+
+class BlobSink:
+    """Long-lived Blob Storage writer for one container.
+
+    The service/container clients and their HTTP connection pool are created
+    once and reused for every upload. The container is checked (and created
+    if missing) once per run. `upload_many` uploads with up to `max_workers`
+    concurrent requests, on the async client when aiohttp is installed and on
+    a thread pool otherwise.
+
+    Uploads are dicts with a "name" and "data" (bytes, str or a Path to read),
+    an optional "git_sha", plus any extra upload_blob keyword arguments (such
+    as "tags" from manifest_tags). Every
+    upload records its SHA-256 (and the upstream git SHA) in blob metadata, so
+    `unchanged`/`list_hashes` never need to download blob contents.
+    """
+
+    def __init__(self, connection_string=STORAGE_CONNECTION_STRING, container_name=CONTAINER_NAME,
+                 max_workers=UPLOAD_WORKERS, use_async=True):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.max_workers = max_workers
+        self.use_async = use_async and AsyncBlobServiceClient is not None
+
+        # Size the connection pool to the worker count so threads don't queue on it
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.service_client = BlobServiceClient.from_connection_string(
+            connection_string, transport=RequestsTransport(session=session, session_owner=True))
+        self.container_client = self.service_client.get_container_client(container_name)
+
+        self._container_ready = False
+        self._lock = threading.Lock()
+        # Async client and the event loop it lives on, created on first use
+        self._loop = None
+        self._async_service_client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def ensure_container(self):
+        with self._lock:
+            if self._container_ready:
+                return
+            try:
+                self.container_client.create_container()
+                print(f"\033[36mCreated blob container '{self.container_name}'.\033[0m")
+            except ResourceExistsError:
+                pass
+            except HttpResponseError as e:
+                # A SAS or key scoped to an existing container may not create
+                # containers (403); like the original upload path, carry on and
+                # let the uploads report any real problem
+                if e.status_code != 403:
+                    print(f"\033[33mCould not create blob container '{self.container_name}': {e}\033[0m")
+            self._container_ready = True
+
+    def upload(self, name, data, overwrite=True, **kwargs):
+        self.ensure_container()
+        data, kwargs = _with_hashes(data, **kwargs)
+        self.container_client.upload_blob(name=name, data=data, overwrite=overwrite, **kwargs)
+        return True
+
+    def get_properties(self, name):
+        """Blob metadata plus its Content-MD5 (hex), from one HEAD request; None if missing."""
+        try:
+            properties = self.container_client.get_blob_client(name).get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        return dict(properties.metadata or {}, content_md5=_md5_hex(properties.content_settings))
+
+    def get_hash(self, name):
+        """Stored SHA-256 of a blob, or None if the blob or the hash is missing."""
+        properties = self.get_properties(name)
+        return properties.get("sha256") if properties else None
+
+    def unchanged(self, name, data):
+        """True if the blob already holds `data`, from one HEAD request (see hashes_match)."""
+        return hashes_match(self.get_properties(name), data)
+
+    def list_hashes(self, prefix=None):
+        """{blob name: metadata plus content_md5} for every blob under `prefix`, from one paged listing."""
+        hashes = {}
+        for blob in self.container_client.list_blobs(name_starts_with=prefix, include=["metadata"]):
+            hashes[blob.name] = dict(blob.metadata or {}, content_md5=_md5_hex(blob.content_settings))
+        return hashes
+
+    def _upload_one(self, upload):
+        upload = dict(upload)
+        name = upload.pop("name")
+        try:
+            return name, self.upload(name, upload.pop("data"), **upload)
+        except Exception as e:
+            print(f"\033[31mError uploading {name}: {e}\033[0m")
+            return name, False
+
+    def upload_many(self, uploads):
+        """Upload concurrently; returns {blob name: True/False}."""
+        uploads = list(uploads)
+        if not uploads:
+            return {}
+        self.ensure_container()
+        if self.use_async and len(uploads) > 1:
+            return asyncio.run_coroutine_threadsafe(self._upload_many_async(uploads), self._async_loop()).result()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(pool.map(self._upload_one, uploads))
+
+    def _async_loop(self):
+        """The sink's event loop, running on its own thread.
+
+        The async client's aiohttp session is bound to the loop it was opened
+        on, so one long-lived loop lets every upload_many reuse the same
+        client and connection pool.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="blob-sink-loop", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    async def _upload_many_async(self, uploads):
+        if self._async_service_client is None:
+            self._async_service_client = AsyncBlobServiceClient.from_connection_string(self.connection_string)
+        container_client = self._async_service_client.get_container_client(self.container_name)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def upload_one(upload):
+            upload = dict(upload)
+            name = upload.pop("name")
+            async with semaphore:
+                try:
+                    overwrite = upload.pop("overwrite", True)
+                    data, kwargs = _with_hashes(upload.pop("data"), **upload)
+                    await container_client.upload_blob(name=name, data=data, overwrite=overwrite, **kwargs)
+                    return name, True
+                except Exception as e:
+                    print(f"\033[31mError uploading {name}: {e}\033[0m")
+                    return name, False
+
+        return dict(await asyncio.gather(*(upload_one(upload) for upload in uploads)))
+
+    def delete_many(self, names):
+        """Delete blobs with the Blob batch API; returns the names that were removed."""
+        names = list(names)
+        deleted = []
+        for start in range(0, len(names), MAX_DELETE_BATCH):
+            chunk = names[start:start + MAX_DELETE_BATCH]
+            responses = self.container_client.delete_blobs(*chunk, raise_on_any_failure=False)
+            for name, response in zip(chunk, responses):
+                # 404 means it is already gone, which is what we wanted
+                if response.status_code in (202, 404):
+                    deleted.append(name)
+                else:
+                    print(f"\033[31mError deleting {name}: HTTP {response.status_code}\033[0m")
+        return deleted
+
+    def close(self):
+        if self._loop is not None:
+            if self._async_service_client is not None:
+                asyncio.run_coroutine_threadsafe(self._async_service_client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = self._async_service_client = None
+        self.service_client.close()
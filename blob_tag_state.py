@@ -0,0 +1,75 @@
+from packaging.version import Version, InvalidVersion
+
+# Every tagged manifest carries all three; see blob_sink.manifest_tags.
+TAG_QUERY = "\"appId\" > '' AND \"packageVersion\" > '' AND \"gitsha\" > ''"
+
+
+def version_key(version):
+    """Sort key for package versions; PEP 440 versions sort above anything unparseable."""
+    try:
+        return (1, Version(version), "")
+    except InvalidVersion:
+        return (0, Version("0"), version)
+
+
+class BlobTagStateBackend:
+    """App state read from the blob index tags written by BlobSink.
+
+    For Blob-only deployments: one find_blobs_by_tags query returns the
+    appId/packageVersion/gitsha of every tagged manifest, and the newest
+    version per app becomes the snapshot. Writes need no extra request,
+    because the tags travel with the blob upload, so updates only refresh
+    the in-memory snapshot. Exposes the same methods as TableStateBackend.
+    """
+
+    def __init__(self, blob_sink):
+        self.blob_sink = blob_sink
+        self.snapshot = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def load_snapshot(self):
+        snapshot = {}
+        for blob in self.blob_sink.container_client.find_blobs_by_tags(TAG_QUERY):
+            tags = blob.tags or {}
+            app_id = tags.get("appId")
+            current = snapshot.get(app_id)
+            if current and version_key(current["version"]) >= version_key(tags["packageVersion"]):
+                continue
+            snapshot[app_id] = {"AppID": app_id, "version": tags["packageVersion"],
+                                "gitsha": tags["gitsha"], "Blobpath": blob.name}
+        self.snapshot = snapshot
+        return snapshot
+
+    def get_state(self, row_key):
+        return self.snapshot.get(row_key, {})
+
+    def get_sha(self, row_key):
+        return self.get_state(row_key).get("gitsha") or None
+
+    def get_shas(self, app_ids):
+        """{app_id: gitsha} for the given apps, from the current snapshot."""
+        return {app_id: self.get_sha(app_id) for app_id in app_ids}
+
+    def queue_patch(self, row_key, patch):
+        self.snapshot.setdefault(row_key, {}).update(patch)
+
+    def update_entity(self, app_id, version=None, blob_path=None, github_path=None, hash_value=None, git_sha=None):
+        patch = {}
+        if version:
+            patch["version"] = version
+        if blob_path:
+            patch["Blobpath"] = blob_path
+        if git_sha:
+            patch["gitsha"] = git_sha
+        self.queue_patch(app_id, patch)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,97 @@
+import os
+from azure.core import MatchConditions
+from azure.cosmos import CosmosClient, exceptions
+from dotenv import load_dotenv
+load_dotenv()
+
+COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
+COSMOS_KEY = os.getenv("COSMOS_KEY")
+COSMOS_DATABASE = os.getenv("COSMOS_DATABASE")
+COSMOS_CONTAINER = os.getenv("COSMOS_CONTAINER")
+# How often an update is re-read and reapplied after losing an ETag race
+CONFLICT_RETRIES = 5
+
+# Table-style field names (as used by TableStateBackend) -> Cosmos document fields
+FIELD_MAP = {"AppID": "appId", "version": "packageVersion", "Blobpath": "manifestBlobpath",
+             "githubpath": "githubFolderPath", "gitsha": "gitsha"}
+
+
+class CosmosStateBackend:
+    """The Cosmos DB app documents of download_manifest17.py behind the
+    TableStateBackend interface (load_snapshot/get_state/queue_patch/close).
+
+    The snapshot comes from one projected cross-partition query and uses the
+    Table field names, so callers need not know which store they talk to.
+    Patches are buffered and written on flush() as ETag-guarded
+    read-modify-replace, reapplied on conflict. download_manifest17.py and
+    the pipeline engine both write through it.
+    """
+
+    def __init__(self, endpoint=COSMOS_ENDPOINT, key=COSMOS_KEY, database_name=COSMOS_DATABASE,
+                 container_name=COSMOS_CONTAINER):
+        self.client = CosmosClient(endpoint, key)
+        self.container = self.client.get_database_client(database_name).get_container_client(container_name)
+        self.snapshot = {}
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def load_snapshot(self, fields=("AppID", "version", "gitsha")):
+        columns = ", ".join(f"c.{FIELD_MAP.get(field, field)}" for field in {"AppID", *fields})
+        self.snapshot = {}
+        for item in self.container.query_items(query=f"SELECT {columns} FROM c", enable_cross_partition_query=True):
+            app_id = item.get("appId")
+            if app_id:
+                self.snapshot[app_id.strip()] = {field: item.get(FIELD_MAP.get(field, field)) for field in {"AppID", *fields}}
+        return self.snapshot
+
+    def get_state(self, row_key):
+        return self.snapshot.get(row_key, {})
+
+    def get_sha(self, row_key):
+        return self.get_state(row_key).get("gitsha") or None
+
+    def queue_patch(self, row_key, patch):
+        self._pending.setdefault(row_key, {}).update(patch)
+        self.snapshot.setdefault(row_key, {}).update(patch)
+
+    def update_entity(self, app_id, version=None, blob_path=None, github_path=None, hash_value=None, git_sha=None):
+        patch = {"version": version, "Blobpath": blob_path, "githubpath": github_path, "gitsha": git_sha}
+        patch = {field: value for field, value in patch.items() if value}
+        if patch:
+            self.queue_patch(app_id, patch)
+
+    def _apply(self, app_id, patch):
+        patch = {FIELD_MAP.get(field, field): value for field, value in patch.items()}
+        query = "SELECT * FROM c WHERE c.appId = @app_id"
+        parameters = [{"name": "@app_id", "value": app_id}]
+        for _ in range(CONFLICT_RETRIES):
+            results = list(self.container.query_items(query=query, parameters=parameters,
+                                                      enable_cross_partition_query=True))
+            if not results:
+                print(f"\033[31mError: No entity found for AppID: {app_id}\033[0m")
+                return
+            entity = results[0]
+            entity.update(patch)
+            try:
+                self.container.replace_item(item=entity, body=entity, etag=entity["_etag"],
+                                            match_condition=MatchConditions.IfNotModified)
+                return
+            except exceptions.CosmosAccessConditionFailedError:
+                print(f"\033[33mETag conflict for AppID: {app_id}, reapplying update.\033[0m")
+        print(f"\033[31mGave up updating AppID {app_id} after {CONFLICT_RETRIES} conflicts\033[0m")
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for app_id, patch in pending.items():
+            try:
+                self._apply(app_id, patch)
+            except exceptions.CosmosHttpResponseError as e:
+                print(f"\033[31mError updating entity for AppID {app_id}: {e}\033[0m")
+
+    def close(self):
+        self.flush()
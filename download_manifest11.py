@@ -3,7 +3,7 @@ import json
 from pathlib import Path
 import os
 import hashlib
-from azure.storage.blob import BlobServiceClient
+from blob_sink import BlobSink
 from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from dotenv import load_dotenv
 load_dotenv()
@@ -71,13 +71,14 @@ def calculate_file_hash(file_path):
             hasher.update(chunk)
     return hasher.hexdigest()
 
-def get_blob_hash(blob_client):
+def blob_unchanged(blob_sink, blob_name, data):
+    # One HEAD request: the SHA-256 kept in the blob's metadata, or its
+    # Content-MD5 for blobs uploaded before the SHA-256 was recorded
     try:
-        blob_data = blob_client.download_blob().readall()
-        return hashlib.sha256(blob_data).hexdigest()
+        return blob_sink.unchanged(blob_name, data)
     except Exception as e:
         print(f"Error fetching blob hash: {e}")
-        return None
+        return False
     
 #Azure service Bus
 
@@ -99,24 +100,18 @@ def send_service_bus_message(app_name, app_version, blob_url, manifest_url):
         print(f"Error sending message to Service Bus: {e}")
 
 
-def upload_to_azure(file_path, blob_name, latest_verion, app_id ,manifest_url):
-    blob_service_client = BlobServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
-    blob_client = blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=blob_name)
+def upload_to_azure(blob_sink, file_path, blob_name, latest_verion, app_id ,manifest_url):
 
     # Calculate file hash
     local_file_hash = calculate_file_hash(file_path)
     print(f"Local file hash for {file_path}: {local_file_hash}")
 
-    existing_blob_hash = get_blob_hash(blob_client)
-    if existing_blob_hash:
-        print(f"Existing blob hash for {blob_name}: {existing_blob_hash}")
-        if local_file_hash == existing_blob_hash:
-            print(f"No changes detected for {blob_name}. Skipping upload.")
-            return
+    if blob_unchanged(blob_sink, blob_name, Path(file_path)):
+        print(f"No changes detected for {blob_name}. Skipping upload.")
+        return
 
     try:
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
+        blob_sink.upload(blob_name, Path(file_path), overwrite=True)
         print(f"Uploaded {file_path} to Azure Blob Storage as {blob_name}")
         send_service_bus_message(app_id, latest_verion, blob_name, manifest_url)
     except Exception as e:
@@ -138,6 +133,7 @@ def main():
         return
 
     Path(DOWNLOAD_FOLDER).mkdir(exist_ok=True)
+    blob_sink = BlobSink(STORAGE_CONNECTION_STRING, CONTAINER_NAME)
 
     for app_id in apps:
         manifest_url, latest_verion = get_latest_version_url(app_id)
@@ -147,7 +143,7 @@ def main():
                 updated_downloaded_file = str(downloaded_file).replace("\\", "/")
                 blob_name = "/".join(updated_downloaded_file.split("/", 1)[1:])
                 #print(f"Blob_name : {blob_name}")
-                upload_to_azure(downloaded_file, blob_name, latest_verion, app_id, manifest_url)
+                upload_to_azure(blob_sink, downloaded_file, blob_name, latest_verion, app_id, manifest_url)
 
 if __name__ == "__main__":
 
@@ -3,12 +3,12 @@ import json
 from pathlib import Path
 import os
 import hashlib
-from azure.storage.blob import BlobServiceClient
+from blob_sink import BlobSink
 from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from datetime import datetime, timedelta, timezone
 import time
 import re
-from azure.data.tables import TableServiceClient, UpdateMode
+from table_state import TableStateBackend
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -32,59 +32,19 @@ PARTITION_KEY = "Apps"
 def load_apps_from_table():
     """Load app entities from Azure Table Storage and ensure completeness."""
     try:
-        table_service_client = TableServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
-        table_client = table_service_client.get_table_client(TABLE_NAME)
-
-        apps = set()
-        for entity in table_client.list_entities():
-            app_id = entity.get("AppID")
-            if app_id:
-                # Ensure all required fields exist
-                updated = False
-                if not entity.get("version"):
-                    entity["version"] = ""
-                    updated = True
-                if not entity.get("Blobpath"):
-                    entity["Blobpath"] = ""
-                    updated = True
-                if not entity.get("githubpath"):
-                    entity["githubpath"] = ""
-                    updated = True
-                if not entity.get("hash"):
-                    entity["hash"] = ""
-                    updated = True
-
-                if updated:
-                    table_client.update_entity(mode=UpdateMode.MERGE, entity=entity)
-                    print(f"Updated missing fields for AppID: {app_id}")
-
-                apps.add(app_id.strip())
+        state = TableStateBackend(STORAGE_CONNECTION_STRING, TABLE_NAME, PARTITION_KEY)
+        apps = state.load_apps()
 
         print(f"Loaded {len(apps)} apps from Azure Table Storage.")
-        return apps, table_client
+        return apps, state
     except Exception as e:
         print(f"Error loading apps from Azure Table Storage: {e}")
         return set(), None
 
-def update_entity(table_client, app_id, version=None, blob_path=None, github_path=None, hash_value=None):
-    """Update specific fields of an entity in Azure Table Storage."""
-    try:
-        entity = table_client.get_entity(partition_key=PARTITION_KEY, row_key=app_id)
-
-        # Update the fields if provided
-        if version:
-            entity["version"] = version
-        if blob_path:
-            entity["Blobpath"] = blob_path
-        if github_path:
-            entity["githubpath"] = github_path
-        if hash_value:
-            entity["hash"] = hash_value
-
-        table_client.update_entity(mode=UpdateMode.MERGE, entity=entity)
-        print(f"Updated entity for AppID: {app_id}")
-    except Exception as e:
-        print(f"Error updating entity for AppID: {app_id}: {e}")
+def update_entity(state, app_id, version=None, blob_path=None, github_path=None, hash_value=None):
+    """Queue a merge of the given fields; written with the entity ETag on flush."""
+    state.update_entity(app_id, version=version, blob_path=blob_path, github_path=github_path, hash_value=hash_value)
+    print(f"Queued entity update for AppID: {app_id}")
 #for testing purpose only remove for production
 
 SAVE_FILE = "recent_merged_prs.json"
@@ -157,13 +117,14 @@ def calculate_file_hash(file_path):
             hasher.update(chunk)
     return hasher.hexdigest()
 
-def get_blob_hash(blob_client):
+def blob_unchanged(blob_sink, blob_name, data):
+    # One HEAD request: the SHA-256 kept in the blob's metadata, or its
+    # Content-MD5 for blobs uploaded before the SHA-256 was recorded
     try:
-        blob_data = blob_client.download_blob().readall()
-        return hashlib.sha256(blob_data).hexdigest()
+        return blob_sink.unchanged(blob_name, data)
     except Exception as e:
         print(f"Error fetching blob hash: {e}")
-        return None
+        return False
     
 #Azure service Bus
 
@@ -185,27 +146,20 @@ def send_service_bus_message(app_name, blob_url, manifest_url, status):
         print(f"Error sending message to Service Bus: {e}")
 
 
-def upload_to_azure(file_path, blob_name, latest_version, app_id, table_client, manifest_url, status):
-    blob_service_client = BlobServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
-    blob_client = blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=blob_name)
+def upload_to_azure(blob_sink, file_path, blob_name, latest_version, app_id, state, manifest_url, status):
 
     # Calculate file hash
     local_file_hash = calculate_file_hash(file_path)
     print(f"Local file hash for {file_path}: {local_file_hash}")
 
-    existing_blob_hash = get_blob_hash(blob_client)
-    if existing_blob_hash:
-        print(f"Existing blob hash for {blob_name}: {existing_blob_hash}")
-        if local_file_hash == existing_blob_hash:
-            #update_entity(table_client, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=local_file_hash)
-            print(f"No changes detected for {blob_name}. Skipping upload.")
-            return
+    if blob_unchanged(blob_sink, blob_name, Path(file_path)):
+        print(f"No changes detected for {blob_name}. Skipping upload.")
+        return
 
     try:
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
+        blob_sink.upload(blob_name, Path(file_path), overwrite=True)
         print(f"Uploaded {file_path} to Azure Blob Storage as {blob_name}")
-        update_entity(table_client, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=local_file_hash)
+        update_entity(state, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=local_file_hash)
         send_service_bus_message(app_id, blob_name, manifest_url, status)
     except Exception as e:
         print(f"Error uploading {file_path}: {e}")
@@ -267,7 +221,7 @@ def fetch_merged_pull_requests():
 def main():
 
 
-    apps, table_client = load_apps_from_table()
+    apps, state = load_apps_from_table()
 
     if not apps:
         print("Error: No apps found in Azure Table Storage!")
@@ -285,6 +239,7 @@ def main():
     #     return
 
     Path(DOWNLOAD_FOLDER).mkdir(exist_ok=True)
+    blob_sink = BlobSink(STORAGE_CONNECTION_STRING, CONTAINER_NAME)
 
 #for testing purpuse only
     recent_merged_prs = load_from_file(SAVE_FILE)
@@ -337,12 +292,15 @@ def main():
                         updated_downloaded_file = str(downloaded_file).replace("\\", "/")
                         blob_name = "/".join(updated_downloaded_file.split("/", 1)[1:])
                         print(f"Blob_name : {blob_name}")
-                        upload_to_azure(downloaded_file, blob_name, latest_version, app_id, table_client, manifest_url, status)
-                        #update_entity(table_client, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url)
+                        upload_to_azure(blob_sink, downloaded_file, blob_name, latest_version, app_id, state, manifest_url, status)
+                        #update_entity(state, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url)
                         print()
             else:
                 print(f"App Name: {app_id} not found in Azure Table,  Skipping...... ")
 
+    blob_sink.close()
+    state.close()
+
 
 if __name__ == "__main__":
 
@@ -6,7 +6,7 @@ import hashlib
 from azure.storage.blob import BlobServiceClient
 from azure.servicebus import ServiceBusClient, ServiceBusMessage
 from packaging.version import Version
-from azure.data.tables import TableServiceClient, UpdateMode
+from table_state import TableStateBackend
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -29,64 +29,20 @@ PARTITION_KEY = "Apps"
 def load_apps_from_table():
     """Load app entities from Azure Table Storage and ensure completeness."""
     try:
-        table_service_client = TableServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
-        table_client = table_service_client.get_table_client(TABLE_NAME)
-
-        apps = set()
-        for entity in table_client.list_entities():
-            app_id = entity.get("AppID")
-            if app_id:
-                # Ensure all required fields exist
-                updated = False
-                if not entity.get("version"):
-                    entity["version"] = ""
-                    updated = True
-                if not entity.get("Blobpath"):
-                    entity["Blobpath"] = ""
-                    updated = True
-                if not entity.get("githubpath"):
-                    entity["githubpath"] = ""
-                    updated = True
-                if not entity.get("hash"):
-                    entity["hash"] = ""
-                    updated = True
-                if not entity.get("gitsha"):
-                    entity["gitsha"] = ""
-                    updated = True
-
-                if updated:
-                    table_client.update_entity(mode=UpdateMode.MERGE, entity=entity)
-                    print(f"Updated missing fields for AppID: {app_id}")
-
-                apps.add(app_id.strip())
+        state = TableStateBackend(STORAGE_CONNECTION_STRING, TABLE_NAME, PARTITION_KEY)
+        # One projected snapshot; missing fields are backfilled as queued patches
+        apps = state.load_apps()
 
         print(f"Loaded {len(apps)} apps from Azure Table Storage.")
-        return apps, table_client
+        return apps, state
     except Exception as e:
         print(f"Error loading apps from Azure Table Storage: {e}")
         return set(), None
 
-def update_entity(table_client, app_id, version=None, blob_path=None, github_path=None, hash_value=None, git_sha=None):
-    """Update specific fields of an entity in Azure Table Storage."""
-    try:
-        entity = table_client.get_entity(partition_key=PARTITION_KEY, row_key=app_id)
-
-        # Update the fields if provided
-        if version:
-            entity["version"] = version
-        if blob_path:
-            entity["Blobpath"] = blob_path
-        if github_path:
-            entity["githubpath"] = github_path
-        if hash_value:
-            entity["hash"] = hash_value
-        if git_sha:
-            entity["gitsha"] = git_sha
-
-        table_client.update_entity(mode=UpdateMode.MERGE, entity=entity)
-        print(f"Updated entity for AppID: {app_id}")
-    except Exception as e:
-        print(f"Error updating entity for AppID: {app_id}: {e}")
+def update_entity(state, app_id, version=None, blob_path=None, github_path=None, hash_value=None, git_sha=None):
+    """Queue a merge of the given fields; written in batched, ETag-guarded transactions on flush."""
+    state.update_entity(app_id, version=version, blob_path=blob_path, github_path=github_path, hash_value=hash_value, git_sha=git_sha)
+    print(f"Queued entity update for AppID: {app_id}")
 
 
 def get_latest_version_url(app_id):
@@ -142,19 +98,14 @@ def calculate_file_hash(file_path):
             hasher.update(chunk)
     return hasher.hexdigest()
 
-def get_blob_hash(table_client, app_id):
-    try:
-        entity = table_client.get_entity(partition_key="Apps", row_key=app_id)
-        
-        hash_value = entity.get("gitsha")
-        if hash_value:
-            print(f"Git Commit Hash value for AppID {app_id}: {hash_value}")
-            return hash_value
-        else:
-            print(f"No Git Commit hash value found for AppID {app_id}")
-            return None
-    except Exception as e:
-        print(f"Error fetching hash from Azure Table for AppID {app_id}: {e}")
+def get_blob_hash(state, app_id):
+    # Served from the snapshot taken by load_apps_from_table, no request per app
+    hash_value = state.get_sha(app_id)
+    if hash_value:
+        print(f"Git Commit Hash value for AppID {app_id}: {hash_value}")
+        return hash_value
+    else:
+        print(f"No Git Commit hash value found for AppID {app_id}")
         return None
 
 def get_blob_hash2(blob_client):
@@ -186,7 +137,7 @@ def send_service_bus_message(app_name,latest_version ,blob_url, manifest_url, st
         print(f"Error sending message to Service Bus: {e}")
 
 
-def upload_to_azure(file_path, blob_name, latest_version, app_id, table_client, manifest_url, latest_sha):
+def upload_to_azure(file_path, blob_name, latest_version, app_id, state, manifest_url, latest_sha):
     blob_service_client = BlobServiceClient.from_connection_string(STORAGE_CONNECTION_STRING)
     blob_client = blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=blob_name)
 
@@ -197,12 +148,12 @@ def upload_to_azure(file_path, blob_name, latest_version, app_id, table_client,
     local_file_hash = latest_sha
     print(f"Latest git commit hash for {app_id}: {local_file_hash}")
 
-    existing_blob_hash = get_blob_hash(table_client, app_id)
+    existing_blob_hash = get_blob_hash(state, app_id)
     #existing_blob_hash = get_blob_hash2(blob_client)
     if existing_blob_hash:
         print(f"Existing blob hash for {blob_name}: {existing_blob_hash}")
         if local_file_hash == existing_blob_hash:
-            update_entity(table_client, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=None, git_sha=latest_sha)
+            update_entity(state, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=None, git_sha=latest_sha)
             print(f"No changes detected for {blob_name}. Skipping upload.")
             return
 
@@ -210,7 +161,7 @@ def upload_to_azure(file_path, blob_name, latest_version, app_id, table_client,
         # with open(file_path, "rb") as data:
         #     blob_client.upload_blob(data, overwrite=False)
         print(f"Uploaded {file_path} to Azure Blob Storage as {blob_name}")
-        update_entity(table_client, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=None, git_sha=latest_sha)
+        update_entity(state, app_id, version=latest_version, blob_path=blob_name, github_path=manifest_url, hash_value=None, git_sha=latest_sha)
         status="New Version"
         send_service_bus_message(app_id, latest_version, blob_name, manifest_url, status)
     except Exception as e:
@@ -222,7 +173,7 @@ def upload_to_azure(file_path, blob_name, latest_version, app_id, table_client,
 def main():
 
 
-    apps, table_client = load_apps_from_table()
+    apps, state = load_apps_from_table()
 
     if not apps:
         print("Error: No apps found in Azure Table Storage!")
@@ -239,9 +190,11 @@ def main():
                 updated_downloaded_file = str(downloaded_file).replace("\\", "/")
                 blob_name = "/".join(updated_downloaded_file.split("/", 1)[1:])
                 print(f"Blob_name : {blob_name}")
-                upload_to_azure(downloaded_file, blob_name, latest_version, app_id, table_client, manifest_url, latest_sha) #and hope it's a new version :/ (for now)
+                upload_to_azure(downloaded_file, blob_name, latest_version, app_id, state, manifest_url, latest_sha) #and hope it's a new version :/ (for now)
                 print()
 
+    state.close()
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,175 @@
+import json
+import os
+from pathlib import Path
+import requests
+from dotenv import load_dotenv
+load_dotenv()
+
+try:
+    # Optional: a C-backed incremental parser; the stdlib fallback below streams too
+    import ijson
+except ImportError:
+    ijson = None
+
+API_URL = "https://formulae.brew.sh/api"
+INDEX_URLS = {"cask": f"{API_URL}/cask.json", "formula": f"{API_URL}/formula.json"}
+# Field that names an entry in each index (casks have tokens, formulae names)
+INDEX_KEYS = {"cask": "token", "formula": "name"}
+# Local copies of the indexes plus their ETags, revalidated on every run
+CACHE_FOLDER = Path(os.getenv("HOMEBREW_INDEX_CACHE", "homebrew/.index"))
+
+
+def fetch_index(kind, session=None, cache_folder=CACHE_FOLDER):
+    """Path to an up-to-date local copy of the `kind` bulk index.
+
+    Sends If-None-Match with the stored ETag; on 304 the cached file is used
+    as-is, otherwise the new index is streamed to disk and its ETag saved.
+    """
+    session = session or requests.Session()
+    cache_folder.mkdir(parents=True, exist_ok=True)
+    path = cache_folder / f"{kind}.json"
+    etag_path = cache_folder / f"{kind}.json.etag"
+
+    headers = {}
+    if path.exists() and etag_path.exists():
+        headers["If-None-Match"] = etag_path.read_text().strip()
+    response = session.get(INDEX_URLS[kind], headers=headers, timeout=60, stream=True)
+    if response.status_code == 304:
+        print(f"\033[32m{kind}.json not modified; using cached index\033[0m")
+        return path
+    response.raise_for_status()
+
+    # Written next to the cache and swapped in, so a failed download keeps the old copy
+    tmp_path = cache_folder / f"{kind}.json.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=1 << 20):
+            f.write(chunk)
+    tmp_path.replace(path)
+    etag = response.headers.get("ETag")
+    if etag:
+        etag_path.write_text(etag)
+    elif etag_path.exists():
+        etag_path.unlink()
+    print(f"\033[36mDownloaded {kind}.json ({path.stat().st_size} bytes)\033[0m")
+    return path
+
+
+def _iter_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array one at a time.
+
+    Only the current element and a small read buffer are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, started, eof = "", 0, False, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Homebrew index is not a JSON array")
+                started, pos = True, pos + 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number cut off at the chunk boundary still decodes (as a shorter
+                # number), so a value only counts once the delimiter after it is read
+                if eof or (end < len(buffer) and buffer[end] in " \t\r\n,]"):
+                    yield element
+                    pos = end
+                    continue
+        elif eof:
+            raise ValueError("Homebrew index ended before the closing bracket")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_index(path):
+    """Stream the entries of a bulk index file."""
+    if ijson is not None:
+        with open(path, "rb") as f:
+            # use_float keeps numbers as float/int like json.load instead of Decimal
+            yield from ijson.items(f, "item", use_float=True)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_array(f)
+
+
+def cached_etag(kind, cache_folder=CACHE_FOLDER):
+    """ETag of the cached `kind` index, or None."""
+    etag_path = cache_folder / f"{kind}.json.etag"
+    return etag_path.read_text().strip() if etag_path.exists() else None
+
+
+def load_index_file(kind, tokens=None, fields=None, cache_folder=CACHE_FOLDER):
+    """{token: manifest} from the cached `kind` index, limited to `tokens` if given.
+
+    The index is streamed, so only matching entries are kept; with `fields`
+    each kept entry is also cut down to those keys.
+    """
+    key = INDEX_KEYS[kind]
+    manifests = {}
+    for entry in iter_index(cache_folder / f"{kind}.json"):
+        token = entry.get(key)
+        if tokens is not None and token not in tokens:
+            continue
+        manifests[token] = {field: entry[field] for field in fields if field in entry} if fields else entry
+    return manifests
+
+
+def load_index(kind, tokens=None, session=None, fields=None):
+    """Revalidate the `kind` index, then load it as in load_index_file."""
+    fetch_index(kind, session)
+    return load_index_file(kind, tokens, fields)
+
+
+class HomebrewIndex:
+    """Every tracked token's manifest from the two bulk indexes.
+
+    A run costs two conditional requests however many apps are tracked.
+    Lookups prefer casks over formulae, like the per-app cask-then-formula
+    fallback in download_homebrew.py. `fields` projects each kept manifest
+    down to those keys.
+    """
+
+    def __init__(self, tokens=None, session=None, fields=None):
+        self.tokens = tokens
+        self.session = session
+        self.fields = fields
+        self.casks = load_index("cask", tokens, session, fields)
+        self.formulae = load_index("formula", tokens, session, fields)
+        self._etags = {kind: cached_etag(kind) for kind in INDEX_URLS}
+
+    def refresh(self, tokens=None):
+        """Revalidate both indexes; reload (and return True) only if one changed upstream
+        or the tracked tokens did."""
+        tokens_changed = tokens is not None and tokens != self.tokens
+        self.tokens = self.tokens if tokens is None else tokens
+        changed = False
+        for kind in INDEX_URLS:
+            fetch_index(kind, self.session)
+            etag = cached_etag(kind)
+            if tokens_changed or etag is None or etag != self._etags[kind]:
+                manifests = load_index_file(kind, self.tokens, self.fields)
+                if kind == "cask":
+                    self.casks = manifests
+                else:
+                    self.formulae = manifests
+                self._etags[kind] = etag
+                changed = True
+        return changed
+
+    def get(self, token):
+        """(kind, manifest) for a token, or None if neither index has it."""
+        if token in self.casks:
+            return "cask", self.casks[token]
+        if token in self.formulae:
+            return "formula", self.formulae[token]
+        return None
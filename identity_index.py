@@ -0,0 +1,175 @@
+import json
+import re
+from pathlib import Path
+from urllib.parse import urlsplit
+import requests
+from dotenv import load_dotenv
+from blob_tag_state import version_key
+from homebrew_index import HomebrewIndex
+load_dotenv()
+
+WINGET_REPO = "https://api.github.com/repos/microsoft/winget-pkgs/contents/manifests"
+WINGET_REPO_RAW_URL = "https://raw.githubusercontent.com/microsoft/winget-pkgs/master/manifests"
+HEADERS = {"Accept": "application/vnd.github+json"}
+APPS_FILE = "apps.txt"
+INDEX_FILE = "identity_index.json"
+
+# Only the Homebrew fields the heuristics look at are kept from the bulk indexes
+HOMEBREW_FIELDS = ["token", "name", "homepage"]
+# Evidence weights: an identical homepage is strong, a moniker equal to the token
+# fairly strong, a matching display name weak on its own
+HOMEPAGE_SCORE = 3
+MONIKER_SCORE = 2
+NAME_SCORE = 1
+# A match needs homepage or moniker evidence; a display name alone never reaches this
+MIN_SCORE = MONIKER_SCORE
+
+
+def normalize_homepage(url):
+    """scheme-, www- and trailing-slash-free lowercase host + path, or None."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc.removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}" if host else None
+
+
+def normalize_name(name):
+    """Lowercase letters and digits only, so "Mozilla Firefox" == "mozilla-firefox"."""
+    return re.sub(r"[^a-z0-9]", "", name.lower()) if name else None
+
+
+def parse_locale_manifest(text):
+    """PackageName, Publisher, PackageUrl and Moniker from a winget locale manifest."""
+    fields = {}
+    for key, value in re.findall(r"^(PackageName|Publisher|PackageUrl|Moniker|DefaultLocale):[ \t]*(.+?)[ \t]*$",
+                                 text, re.MULTILINE):
+        fields[key] = value.strip("'\"")
+    return fields
+
+
+def fetch_winget_metadata(app_id, session=None):
+    """Name/homepage/moniker of the latest version of a winget package, or None."""
+    session = session or requests.Session()
+    app_path = f"{app_id[0].lower()}/{app_id.replace('.', '/')}"
+    response = session.get(f"{WINGET_REPO}/{app_path}", headers=HEADERS, timeout=30)
+    if response.status_code != 200:
+        print(f"\033[31mFailed to list {app_id}: {response.status_code}\033[0m")
+        return None
+    versions = [item["name"] for item in response.json()
+                if item["type"] == "dir" and any(char.isdigit() for char in item["name"])]
+    if not versions:
+        return None
+    # The listing is in name order, so "10.0" comes before "9.0"
+    base_url = f"{WINGET_REPO_RAW_URL}/{app_path}/{max(versions, key=version_key)}"
+
+    # Most packages default to en-US; otherwise the version manifest names the locale
+    response = session.get(f"{base_url}/{app_id}.locale.en-US.yaml", timeout=30)
+    if response.status_code == 404:
+        version_manifest = session.get(f"{base_url}/{app_id}.yaml", timeout=30)
+        locale = parse_locale_manifest(version_manifest.text).get("DefaultLocale")
+        if not locale:
+            return None
+        response = session.get(f"{base_url}/{app_id}.locale.{locale}.yaml", timeout=30)
+    if response.status_code != 200:
+        return None
+    return parse_locale_manifest(response.text)
+
+
+def build_identity_index(winget_metadata, homebrew_index):
+    """{winget ID: "<kind>/<token>"} for every winget package with a Homebrew match.
+
+    Candidates score by homepage, moniker and name evidence; the best total
+    of at least MIN_SCORE wins, with casks preferred over formulae on a tie.
+    """
+    by_homepage, by_name = {}, {}
+    for kind, manifests in (("cask", homebrew_index.casks), ("formula", homebrew_index.formulae)):
+        for token, manifest in manifests.items():
+            ref = f"{kind}/{token}"
+            homepage = normalize_homepage(manifest.get("homepage"))
+            if homepage:
+                by_homepage.setdefault(homepage, set()).add(ref)
+            names = manifest.get("name")
+            # Cask names are a list of display names; a formula's name is its token
+            for name in ([token] + names if isinstance(names, list) else [token]):
+                if normalize_name(name):
+                    by_name.setdefault(normalize_name(name), set()).add(ref)
+
+    identities = {}
+    for app_id, metadata in winget_metadata.items():
+        scores = {}
+        for ref in by_homepage.get(normalize_homepage(metadata.get("PackageUrl")), ()):
+            scores[ref] = scores.get(ref, 0) + HOMEPAGE_SCORE
+        for ref in by_name.get(normalize_name(metadata.get("Moniker")), ()):
+            scores[ref] = scores.get(ref, 0) + MONIKER_SCORE
+        for ref in by_name.get(normalize_name(metadata.get("PackageName")), ()):
+            scores[ref] = scores.get(ref, 0) + NAME_SCORE
+        scores = {ref: score for ref, score in scores.items() if score >= MIN_SCORE}
+        if scores:
+            identities[app_id] = max(scores, key=lambda ref: (scores[ref], ref.startswith("cask/"), ref))
+    return identities
+
+
+class IdentityIndex:
+    """Winget PackageIdentifier <-> Homebrew token mapping, one lookup either way.
+
+    Stored as compact JSON of {winget ID: "<kind>/<token>"}; the reverse map
+    is rebuilt on load, keyed on (kind, token) since a cask and a formula may
+    share a token.
+    """
+
+    def __init__(self, identities=None):
+        self.identities = dict(identities or {})
+        self._by_token = {tuple(ref.split("/", 1)): app_id for app_id, ref in self.identities.items()}
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path=INDEX_FILE):
+        Path(path).write_text(json.dumps(self.identities, separators=(",", ":"), sort_keys=True), encoding="utf-8")
+
+    def lookup(self, package_id, kind=None):
+        """{"winget", "homebrew", "kind"} for a winget ID or Homebrew token, or None.
+
+        A token is looked up as `kind` ("cask"/"formula") if given, else as a
+        cask first and then a formula, like HomebrewIndex.get.
+        """
+        if package_id in self.identities:
+            app_id = package_id
+        else:
+            keys = [(token_kind, package_id) for token_kind in ([kind] if kind else ["cask", "formula"])]
+            app_id = next((self._by_token[key] for key in keys if key in self._by_token), None)
+        if app_id is None:
+            return None
+        kind, token = self.identities[app_id].split("/", 1)
+        return {"winget": app_id, "homebrew": token, "kind": kind}
+
+
+def main():
+    with open(APPS_FILE, "r") as file:
+        apps = sorted({line.strip() for line in file if line.strip()})
+
+    session = requests.Session()
+    winget_metadata = {}
+    for app_id in apps:
+        metadata = fetch_winget_metadata(app_id, session)
+        if metadata:
+            winget_metadata[app_id] = metadata
+
+    # Whole indexes, projected to the three fields used for matching
+    homebrew_index = HomebrewIndex(session=session, fields=HOMEBREW_FIELDS)
+    index = IdentityIndex(build_identity_index(winget_metadata, homebrew_index))
+    index.save()
+    for app_id in apps:
+        match = index.lookup(app_id)
+        if match:
+            print(f"\033[32m{app_id} -> {match['kind']}/{match['homebrew']}\033[0m")
+        else:
+            print(f"\033[33m{app_id}: no Homebrew match\033[0m")
+    print(f"Saved {len(index.identities)} identities to {INDEX_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from azure.servicebus import ServiceBusClient, ServiceBusMessage
+from azure.servicebus.exceptions import MessageSizeExceededError
+from dotenv import load_dotenv
+from outbox import DEDUP_WINDOW, OUTBOX_PATH, Outbox
+load_dotenv()
+
+SERVICE_BUS_CONNECTION_STRING = os.getenv("SERVICE_BUS_CONNECTION_STRING")
+BATCH_MESSAGES = int(os.getenv("SERVICE_BUS_BATCH_MESSAGES", "100"))
+FLUSH_INTERVAL = float(os.getenv("SERVICE_BUS_FLUSH_INTERVAL", "2"))
+
+
+def notification_id(app_id, version, manifest_sha):
+    """Deterministic message_id for one app version's manifest.
+
+    The same app, version and manifest always give the same ID, so a rerun or
+    an overlapping PR window produces a message that Service Bus duplicate
+    detection (and the local dedup window) recognises as a repeat.
+    """
+    key = "|".join(str(part or "") for part in (app_id, version, manifest_sha))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ServiceBusNotifier:
+    """One Service Bus client and queue sender for a whole run.
+
+    Messages are buffered and sent with create_message_batch once
+    `batch_messages` are pending or `flush_interval` seconds have passed.
+    A batch that reaches the queue's size limit is sent and a new one is
+    started, so one flush may take a few round-trips but never one per
+    message.
+
+    With an `outbox_path` (OUTBOX_PATH, on by default) notify() only writes
+    the message to the SQLite outbox and returns; a background drainer
+    delivers due rows in batches and backs off on failure. Whatever is still
+    undelivered at close() stays in the outbox and goes out on the next run.
+    Set OUTBOX_PATH to an empty string to send from memory instead.
+
+    Messages given a `message_id` (see notification_id) are dropped locally if
+    the same ID was already queued within DEDUP_WINDOW: across runs when the
+    outbox is on, within the run otherwise. The ID is also set on the message
+    for queue-side duplicate detection.
+
+    A `session_id` (the app ID, by convention) lets a session-enabled queue
+    keep per-app ordering while consumers work many apps in parallel. Every
+    message also carries `source` (winget/homebrew) in its application
+    properties so subscriptions can filter without reading bodies.
+    """
+
+    def __init__(self, queue_name, connection_string=SERVICE_BUS_CONNECTION_STRING,
+                 batch_messages=BATCH_MESSAGES, flush_interval=FLUSH_INTERVAL, outbox_path=OUTBOX_PATH,
+                 source=None):
+        self.queue_name = queue_name
+        self.source = source
+        self.client = ServiceBusClient.from_connection_string(connection_string)
+        self.sender = self.client.get_queue_sender(queue_name=queue_name)
+        self.batch_messages = batch_messages
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._seen = {}
+
+        self.outbox = Outbox(outbox_path) if outbox_path else None
+        if self.outbox is not None:
+            self._wake = threading.Event()
+            self._stop = threading.Event()
+            # Starts by delivering anything left over from an earlier run
+            self._drainer = threading.Thread(target=self._drain_loop, name="outbox-drainer", daemon=True)
+            self._drainer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def notify(self, body, application_properties=None, message_id=None, session_id=None):
+        """Queue a message; dict bodies are sent as JSON. Returns False if suppressed as a duplicate."""
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        if self.source:
+            application_properties = dict(application_properties or {}, source=self.source)
+        if self.outbox is not None:
+            pending = self.outbox.record(self.queue_name, body, application_properties, message_id, session_id)
+            if pending is None:
+                print(f"\033[33mSkipping duplicate message {message_id}\033[0m")
+                return False
+            if pending >= self.batch_messages:
+                self._wake.set()
+            return True
+        with self._lock:
+            if message_id:
+                now = time.monotonic()
+                if now - self._seen.get(message_id, -DEDUP_WINDOW) < DEDUP_WINDOW:
+                    print(f"\033[33mSkipping duplicate message {message_id}\033[0m")
+                    return False
+                self._seen[message_id] = now
+            self._pending.append(ServiceBusMessage(body, application_properties=application_properties,
+                                                   message_id=message_id, session_id=session_id))
+            due = (len(self._pending) >= self.batch_messages
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+        return True
+
+    def _send(self, messages):
+        batch = self.sender.create_message_batch()
+        for message in messages:
+            try:
+                batch.add_message(message)
+                continue
+            except MessageSizeExceededError:
+                if len(batch):
+                    self.sender.send_messages(batch)
+                    batch = self.sender.create_message_batch()
+            try:
+                batch.add_message(message)
+            except MessageSizeExceededError:
+                # Too big even for an empty batch; sending it can never succeed
+                print(f"\033[31mSkipping a message that exceeds the Service Bus size limit\033[0m")
+        if len(batch):
+            self.sender.send_messages(batch)
+
+    def _drain_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                # Keep the drainer alive; the rows stay in the outbox
+                print(f"\033[31mOutbox drain failed: {e}\033[0m")
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+    def drain(self):
+        """Deliver due outbox rows; returns False if a send failed.
+
+        Rows are marked per Service Bus batch, so a failure part-way through
+        only retries what was not accepted. Any Service Bus error (including
+        opening the connection during an outage) backs the remaining rows
+        off instead of propagating.
+        """
+        with self._lock:
+            while True:
+                rows = self.outbox.due(self.queue_name, self.batch_messages)
+                if not rows:
+                    return True
+                done = set()
+                try:
+                    batch, ids = self.sender.create_message_batch(), []
+                    for row_id, body, properties, message_id, session_id in rows:
+                        message = ServiceBusMessage(body, application_properties=properties, message_id=message_id,
+                                                    session_id=session_id)
+                        try:
+                            batch.add_message(message)
+                            ids.append(row_id)
+                            continue
+                        except MessageSizeExceededError:
+                            if ids:
+                                self._deliver(batch, ids)
+                                done.update(ids)
+                                batch, ids = self.sender.create_message_batch(), []
+                        try:
+                            batch.add_message(message)
+                            ids.append(row_id)
+                        except MessageSizeExceededError:
+                            # Too big for any batch: retrying can't help, and it would hold
+                            # back its session, so park it for inspection instead
+                            self.outbox.mark_parked([row_id])
+                            done.add(row_id)
+                            print(f"\033[31mOutbox message {row_id} exceeds the Service Bus size limit;"
+                                  f" parked in {self.outbox.path}\033[0m")
+                    if ids:
+                        self._deliver(batch, ids)
+                        done.update(ids)
+                except Exception as e:
+                    failed = [row[0] for row in rows if row[0] not in done]
+                    self.outbox.mark_failed(failed)
+                    print(f"\033[31mError sending {len(failed)} message(s) to Service Bus, kept in outbox: {e}\033[0m")
+                    return False
+
+    def _deliver(self, batch, ids):
+        self.sender.send_messages(batch)
+        self.outbox.mark_delivered(ids)
+        print(f"\033[34mSent {len(ids)} message(s) to Service Bus queue {self.queue_name}\033[0m")
+
+    def flush(self):
+        if self.outbox is not None:
+            self.drain()
+            return
+        with self._lock:
+            messages, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not messages:
+                return
+            try:
+                self._send(messages)
+                print(f"\033[34mSent {len(messages)} message(s) to Service Bus queue {self.queue_name}\033[0m")
+            except Exception as e:
+                print(f"\033[31mError sending {len(messages)} message(s) to Service Bus: {e}\033[0m")
+
+    def close(self):
+        """Stop the drainer and send what is due. Never raises: during an
+        outage undelivered rows simply stay in the outbox for the next run."""
+        try:
+            if self.outbox is not None:
+                self._stop.set()
+                self._wake.set()
+                self._drainer.join()
+            self.flush()
+            if self.outbox is not None:
+                left = self.outbox.pending_count(self.queue_name)
+                if left:
+                    print(f"\033[33m{left} message(s) left in outbox {self.outbox.path} for the next run\033[0m")
+        except Exception as e:
+            print(f"\033[31mError flushing Service Bus notifier: {e}\033[0m")
+        closers = [self.sender.close, self.client.close]
+        if self.outbox is not None:
+            closers.insert(0, self.outbox.close)
+        for close in closers:
+            try:
+                close()
+            except Exception as e:
+                print(f"\033[31mError closing Service Bus notifier: {e}\033[0m")
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+# Delivery retries back off exponentially up to this many seconds
+MAX_BACKOFF = 300
+# Delivered rows are kept this long before being purged; it is also the
+# window in which a repeated message_id is suppressed
+DEDUP_WINDOW = float(os.getenv("NOTIFY_DEDUP_WINDOW", str(24 * 3600)))
+
+
+class Outbox:
+    """SQLite-backed store of notifications waiting for delivery.
+
+    A row is committed (fsync'd) before notify() returns, and only removed
+    once Service Bus has accepted it, so notifications survive crashes and
+    Service Bus outages. Undelivered rows are picked up again by the next
+    run's drainer.
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                body TEXT NOT NULL,
+                properties TEXT,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                delivered REAL,
+                message_id TEXT,
+                session_id TEXT,
+                parked REAL
+            )""")
+        # Outboxes created by earlier versions lack the newer columns
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (("message_id", "TEXT"), ("session_id", "TEXT"), ("parked", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (queue, delivered, next_attempt)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_message_id ON outbox (queue, message_id)")
+
+    def record(self, queue, body, application_properties=None, message_id=None, session_id=None):
+        """Persist one notification; returns how many are pending for `queue`.
+
+        Returns None without recording if `message_id` was already recorded
+        for `queue` within DEDUP_WINDOW.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if message_id and self._conn.execute(
+                        "SELECT 1 FROM outbox WHERE queue = ? AND message_id = ? AND created >= ?",
+                        (queue, message_id, now - DEDUP_WINDOW)).fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return None
+                self._conn.execute(
+                    "INSERT INTO outbox (queue, body, properties, created, message_id, session_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (queue, body, json.dumps(application_properties) if application_properties else None, now,
+                     message_id, session_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE queue = ? AND delivered IS NULL AND parked IS NULL",
+                (queue,)).fetchone()[0]
+
+    def due(self, queue, limit):
+        """Oldest undelivered rows whose retry time has come, as (id, body, properties, message_id, session_id).
+
+        A row waiting on a retry holds back later rows of the same session, so
+        per-app order survives failed sends; other sessions are unaffected.
+        Parked rows are skipped and hold nothing back.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, body, properties, message_id, session_id FROM outbox AS o"
+                " WHERE queue = ? AND delivered IS NULL AND parked IS NULL AND next_attempt <= ?"
+                " AND NOT (session_id IS NOT NULL AND EXISTS (SELECT 1 FROM outbox AS p"
+                "   WHERE p.queue = o.queue AND p.session_id = o.session_id AND p.delivered IS NULL"
+                "   AND p.parked IS NULL AND p.id < o.id AND p.next_attempt > ?))"
+                " ORDER BY id LIMIT ?",
+                (queue, now, now, limit)).fetchall()
+        return [(row_id, body, json.loads(properties) if properties else None, message_id, session_id)
+                for row_id, body, properties, message_id, session_id in rows]
+
+    def mark_delivered(self, ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET delivered = ? WHERE id = ?", [(now, row_id) for row_id in ids])
+            self._conn.execute("DELETE FROM outbox WHERE delivered < ?", (now - DEDUP_WINDOW,))
+
+    def mark_failed(self, ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1,"
+                " next_attempt = ? + MIN(?, 1 << MIN(attempts, 16)) WHERE id = ?",
+                [(now, MAX_BACKOFF, row_id) for row_id in ids])
+
+    def mark_parked(self, ids):
+        """Set aside rows that can never be delivered (e.g. over the size limit).
+
+        They stay in the outbox for inspection but are no longer retried and
+        no longer hold back their session.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET parked = ? WHERE id = ?", [(now, row_id) for row_id in ids])
+
+    def pending_count(self, queue):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE queue = ? AND delivered IS NULL AND parked IS NULL",
+                (queue,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,653 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import requests
+from azure.storage.blob import ContentSettings
+from dotenv import load_dotenv
+from blob_sink import UPLOAD_WORKERS, BlobSink, manifest_tags
+from blob_tag_state import version_key
+from homebrew_index import HomebrewIndex
+from notifier import ServiceBusNotifier, notification_id
+load_dotenv()
+
+# One engine for every manifest pipeline: a source resolves tracked apps to
+# candidates (version + upstream SHA), the engine drops the ones already in
+# state, fetches the rest concurrently, uploads them in one upload_many, then
+# records a notification and a state patch for each stored manifest. State,
+# blob and notify sinks are the shared long-lived clients (TableStateBackend /
+# BlobTagStateBackend / CosmosStateBackend, BlobSink, ServiceBusNotifier), so
+# pooling, batching and the outbox apply to all sources.
+#
+# download_manifest16/17, download_homebrew, download_casks and the update
+# half of update_on_single are entry points over this engine (run_source).
+
+GITHUB_API_URL = "https://api.github.com/repos"
+WINGET_REPO = f"{GITHUB_API_URL}/microsoft/winget-pkgs"
+WINGET_REPO_RAW_URL = "https://raw.githubusercontent.com/microsoft/winget-pkgs/master/manifests"
+GITHUB_PULL_API_URL = f"{WINGET_REPO}/pulls"
+HOMEBREW_API_URL = "https://formulae.brew.sh/api"
+CASK_TREE_URL = f"{GITHUB_API_URL}/Homebrew/homebrew-cask/git/trees/HEAD?recursive=1"
+CASK_RAW_URL = "https://raw.githubusercontent.com/Homebrew/homebrew-cask/HEAD"
+HEADERS = {"Accept": "application/vnd.github+json"}
+APPS_FILE = "apps.txt"
+DOWNLOAD_FOLDER = "manifests"
+HOMEBREW_FOLDER = "homebrew"
+# Keep a local copy of every downloaded winget manifest; uploads go straight from memory either way
+MIRROR_TO_DISK = os.getenv("MIRROR_TO_DISK", "").lower() in ("1", "true", "yes")
+# Store Homebrew manifests as compact, gzip-compressed JSON (on disk and in Blob Storage)
+COMPRESS = os.getenv("HOMEBREW_COMPRESS", "").lower() in ("1", "true", "yes")
+
+STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME")
+SERVICE_BUS_CONNECTION_STRING = os.getenv("SERVICE_BUS_CONNECTION_STRING")
+TABLE_NAME = os.getenv("AZURE_TABLE_NAME", "wingetapptest")
+# "table" (default), "blob" (blob index tags) or "cosmos"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "table").lower()
+
+
+def make_session(pool_size=UPLOAD_WORKERS):
+    """A requests session whose connection pool fits `pool_size` concurrent workers."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def app_path(app_id):
+    return f"{app_id[0].lower()}/{app_id.replace('.', '/')}"
+
+
+def load_apps_from_file(file_path=APPS_FILE):
+    with open(file_path, "r") as file:
+        return sorted({line.strip() for line in file if line.strip()})
+
+
+def winget_apps(state):
+    """Winget IDs in a state snapshot; rows without an AppID (such as cask-only rows) are skipped."""
+    return sorted({entity["AppID"].strip() for entity in state.snapshot.values() if entity.get("AppID")})
+
+
+def cask_rows(state):
+    """{cask token: RowKey} for the snapshot rows that carry an AppName."""
+    return {entity["AppName"]: row_key for row_key, entity in state.snapshot.items() if entity.get("AppName")}
+
+
+# Upstream helpers
+
+def parse_update(title):
+    """Return (app_id, version) for a "New version"/"Update" PR title; version may be None."""
+    match = re.search(r":\s([\w.-]+)\s\(?version\s+\(?([^\s()]+)", title)
+    if match:
+        return match.group(1), match.group(2)
+    match = re.search(r":\s([\w.-]+)\sversion", title)
+    if match:
+        return match.group(1).strip(), None
+    return title[len("New version "):].split()[0], None
+
+
+def coalesce_updates(prs, apps):
+    """Collapse update PRs to {app_id: newest PR version} for tracked apps.
+
+    Several PRs in the window often touch the same package; the manifest
+    lookup, download, upload and notification then run once per app instead
+    of once per PR.
+    """
+    newest = {}
+    for pr in prs:
+        title = pr.get("title")
+        if not (title.startswith("New version") or title.startswith("Update")):
+            continue
+        app_id, version = parse_update(title)
+        if app_id not in apps:
+            print(f"App Name: {app_id} not found in apps.txt,  Skipping...... ")
+            continue
+        print(f"PR Title: {title}")
+        if app_id not in newest or (version and version_key(version) > version_key(newest[app_id] or "")):
+            newest[app_id] = version
+    return newest
+
+
+def fetch_merged_pull_requests(since=None, strict=False):
+    """PRs merged after `since` (an aware datetime; default: the last 24 hours).
+
+    PRs are listed most recently updated first, and merging updates a PR, so
+    the listing stops at the first PR last updated before `since`; an old PR
+    merged just now is still on the first pages. A failed page ends the
+    listing early; with `strict` it raises instead of returning the partial
+    list, so callers keeping a cursor don't skip PRs.
+    """
+    last_24_hours = since or datetime.now(tz=timezone.utc) - timedelta(hours=24)
+    print(f"last 24 Hours: {last_24_hours}")
+
+    recent_merged_prs = []
+    params = {
+        "state": "closed",
+        "sort": "updated",
+        "direction": "desc",
+        "per_page": 100,
+        "page": 1
+    }
+    start_time = time.time()
+    while True:
+        response = requests.get(GITHUB_PULL_API_URL, headers=HEADERS, params=params)
+
+        if response.status_code != 200:
+            print(f"Failed to fetch PRs: {response.status_code} - {response.text}")
+            if strict:
+                raise RuntimeError(f"Failed to fetch PRs: {response.status_code}")
+            break
+
+        prs = response.json()
+        all_prs_outdated = False
+
+        for pr in prs:
+            updated_at = datetime.fromisoformat(pr["updated_at"].replace("Z", "+00:00"))
+            if updated_at < last_24_hours:
+                all_prs_outdated = True
+                break
+            merged_at = pr.get("merged_at")
+            if merged_at:
+                merged_at_dt = datetime.fromisoformat(merged_at.replace("Z", "+00:00"))
+                if merged_at_dt > last_24_hours:
+                    recent_merged_prs.append(pr)
+        if all_prs_outdated:
+            print("All remaining PRs were last updated before the window. Stopping pagination.")
+            break
+
+        if "next" in response.links:
+            params["page"] += 1
+        else:
+            break
+
+    execution_time = time.time() - start_time
+    print(f"Time taken for Fetch: {execution_time:.4f} seconds")
+    return recent_merged_prs
+
+
+def get_cask_tree(session=None):
+    """Every cask file in Homebrew/homebrew-cask from one Trees API call.
+
+    Returns {token: (path, blob SHA)}, for both the sharded Casks/<letter>/<token>.rb
+    layout and the older flat Casks/<token>.rb one.
+    """
+    response = (session or requests).get(CASK_TREE_URL, headers=HEADERS, timeout=60)
+    response.raise_for_status()
+    tree = response.json()
+    if tree.get("truncated"):
+        print("\033[33mCask tree listing was truncated; casks missing from it will be skipped.\033[0m")
+
+    casks = {}
+    for item in tree.get("tree", []):
+        path = item["path"]
+        if item["type"] == "blob" and path.startswith("Casks/") and path.endswith(".rb"):
+            casks[path.rsplit("/", 1)[-1][:-len(".rb")]] = (path, item["sha"])
+    print(f"\033[36mFound {len(casks)} cask file(s) in the tree\033[0m")
+    return casks
+
+
+def serialize_manifest(data, raw=None):
+    """Bytes to store for a Homebrew manifest, gzipped with HOMEBREW_COMPRESS.
+
+    `raw` (the API response body) is stored as-is; without it the manifest is
+    encoded once as compact JSON.
+    """
+    if raw is None:
+        raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if COMPRESS:
+        # mtime=0 keeps the output byte-identical for identical manifests
+        return gzip.compress(raw, mtime=0)
+    return raw
+
+
+def manifest_version(kind, data):
+    """Casks carry their version directly; formulae as versions.stable plus any _revision."""
+    if kind == "cask":
+        return data.get("version")
+    version = (data.get("versions") or {}).get("stable")
+    revision = data.get("revision") or 0
+    return f"{version}_{revision}" if version and revision else version
+
+
+# Sources
+
+class WingetContentsSource:
+    """Latest installer manifest per winget package, via the contents API.
+
+    The version directory's git SHA is the change marker, so unchanged apps
+    cost one listing and nothing else. With `mirror` each stored manifest is
+    also written under DOWNLOAD_FOLDER.
+    """
+
+    name = "winget"
+    queue = "patchjob"
+    partition = "Apps"
+    sha_field = "gitsha"
+    # Patch fields that must all match the stored state for a candidate to be skipped
+    compare_fields = ("gitsha",)
+
+    def __init__(self, app_ids, session=None, mirror=MIRROR_TO_DISK):
+        self.app_ids = list(app_ids)
+        self.session = session or make_session()
+        self.mirror = mirror
+
+    def prepare(self):
+        pass
+
+    def targets(self):
+        return self.app_ids
+
+    def list_versions(self, app_id):
+        """[(version directory, git SHA)] for an app, or None if it is not in the repo.
+
+        Other failures (rate limits, 5xx) raise, so the engine counts the app as failed.
+        """
+        response = self.session.get(f"{WINGET_REPO}/contents/manifests/{app_path(app_id)}", headers=HEADERS, timeout=30)
+        if response.status_code == 404:
+            print(f"\033[33m{app_id} not found in winget-pkgs\033[0m")
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to list {app_id}: {response.status_code}")
+        return [(item["name"], item["sha"]) for item in response.json()
+                if item["type"] == "dir" and any(char.isdigit() for char in item["name"])]
+
+    def resolve(self, app_id):
+        versions = self.list_versions(app_id)
+        if not versions:
+            return None
+        version, sha = max(versions, key=lambda item: version_key(item[0]))
+        file_name = f"{app_id}.installer.yaml"
+        url = f"{WINGET_REPO_RAW_URL}/{app_path(app_id)}/{version}/{file_name}"
+        blob_name = f"{app_path(app_id)}/{version}/{file_name}"
+        return {
+            "app_id": app_id, "version": version, "sha": sha, "url": url, "blob_name": blob_name,
+            "upload": {"git_sha": sha, "tags": manifest_tags(app_id, version, sha)},
+            "message": {"ApplicationName": app_id, "ApplicationVersion": version, "BlobUrl": blob_name, "GithubUrl": url},
+            "patch": {"version": version, "Blobpath": blob_name, "githubpath": url, "gitsha": sha},
+            "mirror": Path(DOWNLOAD_FOLDER) / blob_name if self.mirror else None,
+        }
+
+    def fetch(self, candidate):
+        response = self.session.get(candidate["url"], timeout=30)
+        if response.status_code != 200:
+            print(f"\033[31mFailed to download {candidate['url']}: {response.status_code}\033[0m")
+            return None
+        return response.content
+
+
+class WingetTreeSource(WingetContentsSource):
+    """Same as WingetContentsSource, listing versions with the git Trees API.
+
+    A tree listing carries only names, types and SHAs, a fraction of the
+    contents API's payload per entry.
+    """
+
+    def list_versions(self, app_id):
+        response = self.session.get(f"{WINGET_REPO}/git/trees/master:manifests/{app_path(app_id)}",
+                                    headers=HEADERS, timeout=30)
+        if response.status_code == 404:
+            print(f"\033[33m{app_id} not found in winget-pkgs\033[0m")
+            return None
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to list {app_id}: {response.status_code}")
+        return [(item["path"], item["sha"]) for item in response.json().get("tree", [])
+                if item["type"] == "tree" and any(char.isdigit() for char in item["path"])]
+
+
+class WingetPRSource(WingetContentsSource):
+    """Tracked apps touched by recently merged winget-pkgs PRs, one pass per app.
+
+    PRs are coalesced with coalesce_updates before any manifest lookup.
+    `prs` defaults to the last 24 hours of merged PRs.
+    """
+
+    def __init__(self, app_ids, prs=None, session=None, mirror=MIRROR_TO_DISK):
+        super().__init__(app_ids, session, mirror)
+        self.prs = prs
+
+    def prepare(self):
+        prs = self.prs if self.prs is not None else fetch_merged_pull_requests()
+        self.app_ids = list(coalesce_updates(prs, set(self.app_ids)))
+
+
+class HomebrewApiSource:
+    """Cask (else formula) JSON per token from formulae.brew.sh.
+
+    A token is unchanged while both its version and ruby_source_checksum
+    match state. With `bulk` every token is served from the
+    cask.json/formula.json indexes (see homebrew_index.py); otherwise each
+    token costs one or two API calls during resolve. With `mirror` each
+    stored manifest is also written under HOMEBREW_FOLDER/<kind>/.
+    """
+
+    name = "homebrew"
+    queue = "hb-update"
+    partition = "Homebrew"
+    sha_field = "checksum"
+    compare_fields = ("version", "checksum")
+
+    def __init__(self, tokens, bulk=False, session=None, index=None, mirror=False):
+        self.tokens = list(tokens)
+        self.bulk = bulk or index is not None
+        self.session = session or make_session()
+        # A caller may pass an already loaded (warm) HomebrewIndex
+        self.index = index
+        self.mirror = mirror
+
+    def prepare(self):
+        if self.bulk and self.index is None:
+            self.index = HomebrewIndex(set(self.tokens), self.session)
+
+    def targets(self):
+        return self.tokens
+
+    def _lookup(self, token):
+        if self.index is not None:
+            found = self.index.get(token)
+            return (found[0], found[1], None) if found else None
+        for kind in ("cask", "formula"):
+            response = self.session.get(f"{HOMEBREW_API_URL}/{kind}/{token}.json", timeout=10)
+            if response.status_code == 200:
+                return kind, json.loads(response.content), response.content
+            if response.status_code != 404:
+                raise RuntimeError(f"Failed to fetch {kind} {token}: {response.status_code}")
+        return None
+
+    def resolve(self, token):
+        found = self._lookup(token)
+        if found is None:
+            print(f"\033[33m{token} not found in cask or formula\033[0m")
+            return None
+        kind, manifest, raw = found
+        version = manifest_version(kind, manifest)
+        checksum = (manifest.get("ruby_source_checksum") or {}).get("sha256") or ""
+        blob_name = f"{kind}/{token}.json"
+        file_name = f"{token}.json.gz" if COMPRESS else f"{token}.json"
+        return {
+            "app_id": token, "version": version, "sha": checksum, "blob_name": blob_name,
+            # Already in hand; fetch() is not needed
+            "data": serialize_manifest(manifest, raw),
+            "upload": {"content_settings": ContentSettings(content_type="application/json",
+                                                           content_encoding="gzip" if COMPRESS else None)},
+            "message": {"ApplicationName": token, "ApplicationVersion": version, "BlobUrl": blob_name, "Kind": kind},
+            "patch": {"version": version, "checksum": checksum, "kind": kind},
+            "mirror": Path(HOMEBREW_FOLDER) / kind / file_name if self.mirror else None,
+        }
+
+    def fetch(self, candidate):
+        return candidate.get("data")
+
+
+class HomebrewCaskSource:
+    """Cask .rb files from Homebrew/homebrew-cask, changed per one Trees API call.
+
+    `app_names` maps each cask token to its state key (the Table RowKey, as
+    in download_casks.py); plain tokens are their own state keys.
+    """
+
+    name = "homebrew"
+    queue = "patchjob"
+    partition = "Apps"
+    sha_field = "caskSha"
+    compare_fields = ("caskSha",)
+
+    def __init__(self, app_names, session=None):
+        self.app_names = dict(app_names) if isinstance(app_names, dict) else {name: name for name in app_names}
+        self.session = session or make_session()
+        self.tree = {}
+
+    def prepare(self):
+        self.tree = get_cask_tree(self.session)
+
+    def targets(self):
+        return list(self.app_names)
+
+    def resolve(self, app_name):
+        if app_name not in self.tree:
+            print(f"\033[33mNo cask file found for '{app_name}'\033[0m")
+            return None
+        path, sha = self.tree[app_name]
+        status = "Upload successful"
+        return {
+            "app_id": app_name, "state_key": self.app_names[app_name], "version": None, "sha": sha,
+            "url": f"{CASK_RAW_URL}/{path}",
+            "blob_name": f"{app_name}.rb", "upload": {"git_sha": sha},
+            # The plain-text message download_casks.py has always sent; the message_id drops repeats
+            "message": f"App '{app_name}': {status}", "status": status,
+            "message_id": notification_id(app_name, status, sha),
+            "patch": {"caskSha": sha},
+        }
+
+    def fetch(self, candidate):
+        response = self.session.get(candidate["url"], timeout=30)
+        return response.content if response.status_code == 200 else None
+
+
+# Engine
+
+class Pipeline:
+    """Discover -> compare -> fetch -> upload -> notify -> record for one source.
+
+    Resolution and fetches run on a pool of `max_workers` threads sharing the
+    source's pooled session; uploads go through one BlobSink.upload_many.
+    Notifications are recorded before the state patch, so a crash in between
+    repeats a notification rather than losing one. Any sink may be None.
+    """
+
+    def __init__(self, source, state=None, blob_sink=None, notifier=None, max_workers=UPLOAD_WORKERS):
+        self.source = source
+        self.state = state
+        self.blob_sink = blob_sink
+        self.notifier = notifier
+        self.max_workers = max_workers
+
+    def unchanged(self, candidate):
+        if self.state is None:
+            return False
+        stored = self.state.get_state(candidate.get("state_key", candidate["app_id"]))
+        return bool(stored) and all(stored.get(field) == candidate["patch"].get(field)
+                                    for field in self.source.compare_fields)
+
+    @staticmethod
+    def mirror(update):
+        path = update.get("mirror")
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(update["data"])
+
+    def run(self, targets=None, results=None):
+        """Process `targets` (default: all of the source's); returns counts per stage.
+
+        If `results` is a dict it is filled with {target: {"status", "version"}},
+        status being one of "not found", "unchanged", "failed" or "stored".
+        A target whose resolve raises, or whose fetch or upload fails, is
+        counted in counts["failed"].
+        """
+        start = time.perf_counter()
+        self.source.prepare()
+        targets = self.source.targets() if targets is None else list(targets)
+        failed = set()
+
+        def resolve(target):
+            try:
+                return self.source.resolve(target)
+            except Exception as e:
+                print(f"\033[31mFailed to resolve {target}: {e}\033[0m")
+                failed.add(target)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            resolved = list(pool.map(resolve, targets))
+            candidates = [c for c in resolved if c]
+            changed = [c for c in candidates if not self.unchanged(c)]
+            datas = list(pool.map(lambda c: c["data"] if c.get("data") is not None else self.source.fetch(c), changed))
+        updates = [dict(c, data=data) for c, data in zip(changed, datas) if data is not None]
+        for update in updates:
+            self.mirror(update)
+
+        if self.blob_sink is not None:
+            uploaded = self.blob_sink.upload_many(dict(u["upload"], name=u["blob_name"], data=u["data"]) for u in updates)
+        else:
+            uploaded = {u["blob_name"]: True for u in updates}
+
+        if results is not None:
+            for target, candidate in zip(targets, resolved):
+                if target in failed:
+                    results[target] = {"status": "failed"}
+                else:
+                    results[target] = {"status": "not found"} if candidate is None else \
+                        {"status": "unchanged", "version": candidate["version"]}
+            for candidate in changed:
+                results[candidate["app_id"]]["status"] = "failed"
+
+        stored = 0
+        for update in updates:
+            if not uploaded.get(update["blob_name"]):
+                continue
+            stored += 1
+            if results is not None:
+                results[update["app_id"]]["status"] = "stored"
+            if self.notifier is not None:
+                properties = {"status": update.get("status", "Update")}
+                if update["version"]:
+                    properties["version"] = update["version"]
+                message_id = update.get("message_id") or notification_id(update["app_id"], update["version"], update["sha"])
+                self.notifier.notify(update["message"], application_properties=properties,
+                                     message_id=message_id, session_id=update["app_id"])
+            if self.state is not None:
+                self.state.queue_patch(update.get("state_key", update["app_id"]), update["patch"])
+
+        counts = {"targets": len(targets), "resolved": len(candidates), "changed": len(changed), "stored": stored,
+                  "failed": len(failed) + len(changed) - stored}
+        print(f"\033[36m{type(self.source).__name__}: {counts} in {time.perf_counter() - start:.2f}s\033[0m")
+        return counts
+
+
+# Wiring
+
+SOURCES = {
+    "winget-contents": WingetContentsSource,
+    "winget-tree": WingetTreeSource,
+    "winget-prs": WingetPRSource,
+    "homebrew-api": HomebrewApiSource,
+    "homebrew-casks": HomebrewCaskSource,
+}
+
+
+def state_backend(source, backend=STATE_BACKEND):
+    """The backend a source's state actually uses.
+
+    Only winget manifests are uploaded with index tags (manifest_tags), so the
+    blob-tag backend applies to winget sources; Homebrew sources keep their
+    state in the Table, as download_homebrew.py and download_casks.py do.
+    """
+    if backend == "blob" and source.name != "winget":
+        return "table"
+    return backend
+
+
+def state_key(source, backend=STATE_BACKEND):
+    """The store a source's state lives in; sources with the same key can share one backend."""
+    backend = state_backend(source, backend)
+    if backend in ("blob", "cosmos"):
+        return (backend,)
+    return ("table", TABLE_NAME, source.partition)
+
+
+def load_state(state, source, backend=STATE_BACKEND, sha_fields=None):
+    """(Re)load a state backend's snapshot with the fields `source` (class or instance) compares.
+
+    A backend shared by several sources passes all their `sha_fields`.
+    """
+    sha_fields = list(sha_fields or [source.sha_field])
+    backend = state_backend(source, backend)
+    if backend == "blob":
+        state.load_snapshot()
+    elif backend == "cosmos":
+        state.load_snapshot(fields=("AppID", "version", *sha_fields))
+    else:
+        state.load_snapshot(fields=["AppID", "AppName", "version", *sha_fields])
+    return state
+
+
+def open_state(source, blob_sink=None, backend=STATE_BACKEND, sha_fields=None):
+    """The configured state backend for a source (class or instance), with its snapshot loaded."""
+    backend = state_backend(source, backend)
+    if backend == "blob":
+        from blob_tag_state import BlobTagStateBackend
+        state = BlobTagStateBackend(blob_sink)
+    elif backend == "cosmos":
+        from cosmos_state import CosmosStateBackend
+        state = CosmosStateBackend()
+    else:
+        from table_state import TableStateBackend
+        state = TableStateBackend(STORAGE_CONNECTION_STRING, TABLE_NAME, source.partition)
+    return load_state(state, source, backend, sha_fields)
+
+
+def run_source(source, state=None, blob_sink=None, workers=UPLOAD_WORKERS):
+    """Run `source` once, then write state and close the sinks; returns the run's counts.
+
+    The notifier is opened for the source's queue if SERVICE_BUS_CONNECTION_STRING
+    is set, and closed last so an outage can't keep the state patches from being written.
+    """
+    notifier = None
+    if SERVICE_BUS_CONNECTION_STRING:
+        notifier = ServiceBusNotifier(source.queue, SERVICE_BUS_CONNECTION_STRING, source=source.name)
+    try:
+        counts = Pipeline(source, state, blob_sink, notifier, workers).run()
+        if state is not None:
+            state.close()
+        if blob_sink is not None:
+            blob_sink.close()
+        return counts
+    finally:
+        if notifier is not None:
+            notifier.close()
+
+
+def build_source(kind, apps, session, bulk=False, prs=None):
+    if kind == "winget-prs":
+        return WingetPRSource(apps, prs, session)
+    if kind == "homebrew-api":
+        return HomebrewApiSource(apps, bulk, session)
+    return SOURCES[kind](apps, session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one manifest pipeline through the shared engine.")
+    parser.add_argument("source", choices=SOURCES)
+    parser.add_argument("--apps", help="File of app IDs/tokens (default: the apps in state, or apps.txt)")
+    parser.add_argument("--bulk", action="store_true", help="homebrew-api: serve tokens from the bulk indexes")
+    parser.add_argument("--prs", help="winget-prs: read PRs from this JSON file instead of the GitHub API")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    args = parser.parse_args()
+
+    session = make_session(args.workers)
+    blob_sink = BlobSink(STORAGE_CONNECTION_STRING, CONTAINER_NAME, max_workers=args.workers)
+    prs = json.loads(Path(args.prs).read_text()) if args.prs else None
+    state = open_state(SOURCES[args.source], blob_sink)
+
+    if args.source == "homebrew-casks":
+        apps = cask_rows(state)
+        if args.apps:
+            # Tokens already in the Table keep their RowKey; new ones become their own
+            apps = {token: apps.get(token, token) for token in load_apps_from_file(args.apps)}
+    elif args.apps:
+        apps = load_apps_from_file(args.apps)
+    elif args.source.startswith("winget") and state.snapshot:
+        apps = winget_apps(state)
+    else:
+        apps = load_apps_from_file()
+    run_source(build_source(args.source, apps, session, args.bulk, prs), state, blob_sink, args.workers)
+
+
+if __name__ == "__main__":
+    main()
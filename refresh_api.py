@@ -0,0 +1,205 @@
+import argparse
+import hmac
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from dotenv import load_dotenv
+load_dotenv()
+
+REFRESH_HOST = os.getenv("REFRESH_HOST", "127.0.0.1")
+REFRESH_PORT = int(os.getenv("REFRESH_PORT", "8081"))
+# Optional bearer token required by the HTTP API
+REFRESH_TOKEN = os.getenv("REFRESH_API_TOKEN", "")
+# How long a finished refresh is served from cache instead of going upstream
+REFRESH_TTL = float(os.getenv("REFRESH_TTL", "60"))
+# Upper bound on apps per request
+MAX_APPS = 100
+KINDS = ("winget", "homebrew-api", "homebrew-casks")
+
+
+class _Flight:
+    """One in-progress refresh that later callers for the same app wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class RefreshCoordinator:
+    """On-demand refreshes over a warm UpdateService.
+
+    Each (kind, app) is refreshed at most once at a time: a request for an
+    app already being refreshed waits for that run's result (singleflight),
+    and finished results are served from cache for `ttl` seconds. The apps a
+    request does lead are refreshed together in one pipeline run, on the
+    service's pooled session and sinks.
+    """
+
+    def __init__(self, service, ttl=REFRESH_TTL):
+        self.service = service
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._inflight = {}
+        self.stats = {"requested": 0, "cached": 0, "coalesced": 0, "refreshed": 0}
+
+    def _run(self, kind, app_ids):
+        source, targets = self.service.source_for(kind, app_ids)
+        results = {app_id: {"status": "untracked"} for app_id in app_ids}
+        if targets:
+            self.service.run(source, targets, results)
+        return results
+
+    def refresh(self, app_ids, kind="winget"):
+        """{app_id: result} for each app; see Pipeline.run for the statuses."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown source kind: {kind}")
+        app_ids = list(dict.fromkeys(app_ids))
+        results, flights, leading = {}, {}, []
+        with self._lock:
+            now = time.monotonic()
+            self._cache = {key: entry for key, entry in self._cache.items() if entry[0] > now}
+            self.stats["requested"] += len(app_ids)
+            for app_id in app_ids:
+                key = (kind, app_id)
+                if key in self._cache:
+                    results[app_id] = dict(self._cache[key][1], cached=True)
+                    self.stats["cached"] += 1
+                elif key in self._inflight:
+                    flights[app_id] = self._inflight[key]
+                    self.stats["coalesced"] += 1
+                else:
+                    flights[app_id] = self._inflight[key] = _Flight()
+                    leading.append(app_id)
+
+        if leading:
+            try:
+                outcomes = self._run(kind, leading)
+            except Exception as e:
+                print(f"\033[31mRefresh of {', '.join(leading)} failed: {e}\033[0m")
+                outcomes = {app_id: {"status": "error", "error": str(e)} for app_id in leading}
+            with self._lock:
+                expires = time.monotonic() + self.ttl
+                self.stats["refreshed"] += len(leading)
+                for app_id in leading:
+                    result = outcomes.get(app_id) or {"status": "not found"}
+                    # Errors are not cached so the next request retries
+                    if result["status"] != "error":
+                        self._cache[(kind, app_id)] = (expires, result)
+                    flight = self._inflight.pop((kind, app_id))
+                    flight.result = result
+                    flight.done.set()
+
+        for app_id, flight in flights.items():
+            flight.done.wait()
+            results[app_id] = flight.result
+        return {app_id: results[app_id] for app_id in app_ids}
+
+
+def make_handler(coordinator, token):
+    class RefreshHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self):
+            if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+                self._reply(401, {"error": "unauthorized"})
+                return False
+            return True
+
+        def _refresh(self, app_ids, kind):
+            if not app_ids:
+                return self._reply(400, {"error": "no apps given"})
+            if len(app_ids) > MAX_APPS:
+                return self._reply(400, {"error": f"at most {MAX_APPS} apps per request"})
+            try:
+                self._reply(200, coordinator.refresh(app_ids, kind))
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+
+        def do_GET(self):
+            """/refresh?app=A&app=B[&kind=winget] or /stats"""
+            if not self._authorized():
+                return
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/stats":
+                return self._reply(200, coordinator.stats)
+            if url.path != "/refresh":
+                return self._reply(404, {"error": "not found"})
+            app_ids = [app_id for value in query.get("app", []) for app_id in value.split(",") if app_id]
+            self._refresh(app_ids, query.get("kind", ["winget"])[0])
+
+        def do_POST(self):
+            """/refresh with {"apps": [...], "kind": "winget"}"""
+            if not self._authorized():
+                return
+            if urlparse(self.path).path != "/refresh":
+                return self._reply(404, {"error": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            # A negative length would make rfile.read() wait for the client to close
+            if length < 0:
+                return self._reply(400, {"error": "invalid Content-Length"})
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._reply(400, {"error": "invalid JSON"})
+            if not isinstance(body, dict):
+                return self._reply(400, {"error": "body must be a JSON object"})
+            app_ids, kind = body.get("apps"), body.get("kind", "winget")
+            if not isinstance(app_ids, list) or not all(isinstance(app_id, str) and app_id for app_id in app_ids):
+                return self._reply(400, {"error": "\"apps\" must be a list of app IDs"})
+            if not isinstance(kind, str):
+                return self._reply(400, {"error": "\"kind\" must be a string"})
+            self._refresh(app_ids, kind)
+
+        def log_message(self, format, *args):
+            print(f"\033[90m{self.address_string()} {format % args}\033[0m")
+
+    return RefreshHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh apps on demand, once from the CLI or over HTTP.")
+    parser.add_argument("apps", nargs="*", help="App IDs/tokens to refresh now (omit with --serve)")
+    parser.add_argument("--kind", choices=KINDS, default="winget")
+    parser.add_argument("--serve", action="store_true", help="Serve the HTTP API instead")
+    parser.add_argument("--host", default=REFRESH_HOST)
+    parser.add_argument("--port", type=int, default=REFRESH_PORT)
+    parser.add_argument("--ttl", type=float, default=REFRESH_TTL, help="Seconds a result is served from cache")
+    args = parser.parse_args()
+    if not args.serve and not args.apps:
+        parser.error("give app IDs to refresh, or --serve")
+
+    from service import UpdateService
+    with UpdateService() as service:
+        coordinator = RefreshCoordinator(service, args.ttl)
+        if not args.serve:
+            for app_id, result in coordinator.refresh(args.apps, args.kind).items():
+                print(f"{app_id}: {result}")
+            return
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(coordinator, REFRESH_TOKEN))
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        print(f"\033[32mRefresh API listening on {args.host}:{args.port}\033[0m")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
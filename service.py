@@ -0,0 +1,240 @@
+import argparse
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from dotenv import load_dotenv
+from blob_sink import UPLOAD_WORKERS, BlobSink
+from homebrew_index import HomebrewIndex
+from identity_index import INDEX_FILE as IDENTITY_INDEX_FILE, IdentityIndex
+from notifier import ServiceBusNotifier
+from pipeline import (CONTAINER_NAME, SERVICE_BUS_CONNECTION_STRING, STORAGE_CONNECTION_STRING, HomebrewApiSource,
+                      HomebrewCaskSource, Pipeline, WingetContentsSource, WingetPRSource, cask_rows,
+                      fetch_merged_pull_requests, load_apps_from_file, load_state, make_session, open_state,
+                      state_key, winget_apps)
+from update_on_single import parse_removal, remove_versions
+load_dotenv()
+
+# Seconds between incremental cycles (merged PRs since the last cycle, Homebrew
+# index revalidation) and between full rescans of every tracked app
+INTERVAL = float(os.getenv("SERVICE_INTERVAL", "300"))
+FULL_RESCAN_INTERVAL = float(os.getenv("SERVICE_FULL_RESCAN_INTERVAL", str(6 * 3600)))
+
+
+class UpdateService:
+    """Resident pipeline runner that keeps its clients and caches warm.
+
+    The pooled HTTP session, BlobSink, one Service Bus notifier per queue
+    (with its outbox drainer), the state snapshots and the Homebrew index are
+    created once and reused by every cycle. Incremental cycles only look at
+    PRs merged since the previous cycle and at Homebrew indexes whose ETag
+    changed, so a quiet cycle costs a PR page and two 304s. A full rescan
+    reloads the snapshots (picking up other writers) and checks every app.
+    """
+
+    def __init__(self, interval=INTERVAL, full_rescan_interval=FULL_RESCAN_INTERVAL, workers=UPLOAD_WORKERS):
+        self.interval = interval
+        self.full_rescan_interval = full_rescan_interval
+        self.workers = workers
+        self.session = make_session(workers)
+        self.blob_sink = BlobSink(STORAGE_CONNECTION_STRING, CONTAINER_NAME, max_workers=workers)
+        # One backend per store (see pipeline.state_key), shared by every
+        # source whose state lives there, with the sources using it
+        self.states = {}
+        self.state_sources = {}
+        self.notifiers = {}
+        self.homebrew_index = None
+        self.since = None
+        self.last_full_rescan = 0.0
+        # One pipeline run at a time; the sinks' buffers are not shared across
+        # runs. Also guards (re)loading the shared state backends.
+        self._run_lock = threading.RLock()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Warm resources
+
+    def _sha_fields(self, key):
+        return list(dict.fromkeys(source_cls.sha_field for source_cls in self.state_sources[key]))
+
+    def state_for(self, source_cls, reload=False):
+        key = state_key(source_cls)
+        with self._run_lock:
+            sources = self.state_sources.setdefault(key, [])
+            # A source with another change marker needs its field in the shared snapshot
+            widened = bool(sources) and source_cls.sha_field not in self._sha_fields(key)
+            if source_cls not in sources:
+                sources.append(source_cls)
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = open_state(source_cls, self.blob_sink, sha_fields=self._sha_fields(key))
+            elif reload or widened:
+                state.flush()
+                load_state(state, source_cls, sha_fields=self._sha_fields(key))
+            return state
+
+    def notifier_for(self, source_cls):
+        if not SERVICE_BUS_CONNECTION_STRING:
+            return None
+        if source_cls.queue not in self.notifiers:
+            self.notifiers[source_cls.queue] = ServiceBusNotifier(source_cls.queue, SERVICE_BUS_CONNECTION_STRING,
+                                                                  source=source_cls.name)
+        return self.notifiers[source_cls.queue]
+
+    def winget_apps(self):
+        state = self.state_for(WingetContentsSource)
+        if state.snapshot:
+            return winget_apps(state)
+        return load_apps_from_file()
+
+    def homebrew_tokens(self):
+        apps = set(load_apps_from_file())
+        if Path(IDENTITY_INDEX_FILE).exists():
+            identity = IdentityIndex.load(IDENTITY_INDEX_FILE)
+            apps = {(identity.lookup(app_id) or {}).get("homebrew", app_id) for app_id in apps}
+        return apps
+
+    def refresh_homebrew_index(self):
+        """Revalidate the bulk indexes; True if the tracked manifests may have changed."""
+        tokens = self.homebrew_tokens()
+        if self.homebrew_index is None:
+            self.homebrew_index = HomebrewIndex(tokens, self.session)
+            return True
+        return self.homebrew_index.refresh(tokens)
+
+    # Runs
+
+    def source_for(self, kind, app_ids):
+        """(source, targets) for the tracked subset of `app_ids`.
+
+        `kind` is "winget", "homebrew-api" or "homebrew-casks". Homebrew
+        tokens go to the per-token API rather than the bulk index, which
+        lags behind the upstream repositories.
+        """
+        app_ids = set(app_ids)
+        if kind == "winget":
+            targets = sorted(app_ids & set(self.winget_apps()))
+            return WingetContentsSource(targets, self.session), targets
+        if kind == "homebrew-api":
+            targets = sorted(app_ids & self.homebrew_tokens())
+            return HomebrewApiSource(targets, session=self.session), targets
+        if kind == "homebrew-casks":
+            casks = {token: row_key for token, row_key in cask_rows(self.state_for(HomebrewCaskSource)).items()
+                     if token in app_ids}
+            return HomebrewCaskSource(casks, self.session), sorted(casks)
+        raise ValueError(f"Unknown source kind: {kind}")
+
+    def run(self, source, targets=None, results=None):
+        """Run one source through the engine on the warm sinks; returns its counts."""
+        source_cls = type(source)
+        with self._run_lock:
+            state = self.state_for(source_cls)
+            counts = Pipeline(source, state, self.blob_sink, self.notifier_for(source_cls),
+                              self.workers).run(targets, results)
+            # Written now rather than at shutdown; the snapshot stays in memory
+            state.flush()
+        return counts
+
+    def remove(self, removals):
+        """Prune the blobs and state of removed winget versions ({app_id: {versions}}), tracked apps only."""
+        tracked = set(self.winget_apps())
+        removals = {app_id: versions for app_id, versions in removals.items() if app_id in tracked}
+        if not removals:
+            return
+        with self._run_lock:
+            state = self.state_for(WingetContentsSource)
+            remove_versions(self.blob_sink, self.notifier_for(WingetContentsSource), state, removals)
+            state.flush()
+
+    def incremental_cycle(self):
+        now = datetime.now(tz=timezone.utc)
+        try:
+            prs = fetch_merged_pull_requests(since=self.since, strict=True)
+        except Exception as e:
+            # The cursor stays put, so the next cycle covers this window again
+            print(f"\033[31mSkipping winget PRs this cycle: {e}\033[0m")
+        else:
+            removals = {}
+            for removal in filter(None, (parse_removal(pr.get("title") or "") for pr in prs)):
+                removals.setdefault(removal[0], set()).add(removal[1])
+            self.remove(removals)
+            counts = self.run(WingetPRSource(self.winget_apps(), prs, self.session))
+            # Only a clean run moves the cursor; otherwise these PRs are read again next cycle
+            if counts["failed"]:
+                print(f"\033[33m{counts['failed']} winget apps failed; keeping the PR cursor at {self.since}\033[0m")
+            else:
+                self.since = now
+        if self.refresh_homebrew_index():
+            tokens = self.homebrew_tokens()
+            self.run(HomebrewApiSource(tokens, session=self.session, index=self.homebrew_index))
+
+    def full_rescan(self):
+        self.since = datetime.now(tz=timezone.utc)
+        for sources in list(self.state_sources.values()):
+            self.state_for(sources[0], reload=True)
+        self.run(WingetContentsSource(self.winget_apps(), self.session))
+        self.refresh_homebrew_index()
+        self.run(HomebrewApiSource(self.homebrew_tokens(), session=self.session, index=self.homebrew_index))
+        casks = cask_rows(self.state_for(HomebrewCaskSource))
+        if casks:
+            self.run(HomebrewCaskSource(casks, self.session))
+        self.last_full_rescan = time.monotonic()
+
+    def cycle(self):
+        start = time.perf_counter()
+        if not self.last_full_rescan or time.monotonic() - self.last_full_rescan >= self.full_rescan_interval:
+            print("\033[36mStarting full rescan\033[0m")
+            self.full_rescan()
+        else:
+            self.incremental_cycle()
+        print(f"\033[36mCycle finished in {time.perf_counter() - start:.2f}s\033[0m")
+
+    def run_forever(self):
+        """Cycle every `interval` seconds until stop(); a failed cycle is logged and retried next time."""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.cycle()
+            except Exception as e:
+                print(f"\033[31mCycle failed: {e}\033[0m")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def close(self):
+        try:
+            for state in self.states.values():
+                state.close()
+            self.blob_sink.close()
+        finally:
+            for notifier in self.notifiers.values():
+                notifier.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the manifest pipelines as a resident service.")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="Seconds between cycles")
+    parser.add_argument("--full-rescan-interval", type=float, default=FULL_RESCAN_INTERVAL)
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--once", action="store_true", help="Run a single cycle and exit")
+    args = parser.parse_args()
+
+    with UpdateService(args.interval, args.full_rescan_interval, args.workers) as service:
+        if args.once:
+            service.cycle()
+            return
+        signal.signal(signal.SIGTERM, service.stop)
+        signal.signal(signal.SIGINT, service.stop)
+        service.run_forever()
+
+
+if __name__ == "__main__":
+    main()
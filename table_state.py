@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableServiceClient, UpdateMode, TableTransactionError
+from dotenv import load_dotenv
+load_dotenv()
+
+STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+TABLE_NAME = os.getenv("AZURE_TABLE_NAME", "wingetapptest")
+PARTITION_KEY = "Apps"
+
+# Table transactions are limited to 100 operations, all in one partition.
+MAX_BATCH_SIZE = 100
+FLUSH_INTERVAL = float(os.getenv("TABLE_FLUSH_INTERVAL", "5"))
+
+# Fields every app entity is expected to carry; load_apps backfills them.
+STATE_FIELDS = ["version", "Blobpath", "githubpath", "gitsha"]
+
+# Columns needed for change detection; everything else stays server side.
+SNAPSHOT_FIELDS = ["AppID", "AppName", "gitsha", "version"]
+# The Table service returns at most 1000 entities per page.
+PAGE_SIZE = 1000
+# How often a patch is re-read and reapplied after losing an ETag race.
+CONFLICT_RETRIES = 5
+
+
+class TableStateBackend:
+    """Buffers app state changes and writes them as Table transactions.
+
+    Patches for the same RowKey are merged in the buffer, since a transaction
+    may only touch each entity once. The buffer is flushed when it reaches
+    `batch_size` operations, and a background thread flushes whatever is
+    buffered once `flush_interval` seconds have passed since the last flush.
+    Patches whose transaction could not be submitted go back into the buffer.
+
+    Writes to entities seen in the snapshot are conditional on their ETag
+    (if-match). When another runner changed an entity in the meantime, it is
+    re-read and the patch is reapplied on top of the current version.
+    """
+
+    def __init__(self, connection_string=STORAGE_CONNECTION_STRING, table_name=TABLE_NAME,
+                 partition_key=PARTITION_KEY, batch_size=MAX_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        table_service_client = TableServiceClient.from_connection_string(connection_string)
+        self.table_client = table_service_client.get_table_client(table_name)
+        self.partition_key = partition_key
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self.snapshot = {}
+        self._etags = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="table-flusher", daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def load_snapshot(self, fields=SNAPSHOT_FIELDS):
+        """Scan the partition once, keeping only `fields`, into self.snapshot."""
+        entities = self.table_client.query_entities(
+            query_filter="PartitionKey eq @pk",
+            parameters={"pk": self.partition_key},
+            select=["RowKey", *fields],
+            results_per_page=PAGE_SIZE,
+        )
+        snapshot, etags = {}, {}
+        for entity in entities:
+            snapshot[entity["RowKey"]] = dict(entity)
+            etags[entity["RowKey"]] = entity.metadata.get("etag")
+        with self._lock:
+            self.snapshot, self._etags = snapshot, etags
+        return self.snapshot
+
+    def load_apps(self):
+        """Return the set of AppIDs, queuing a backfill for missing fields."""
+        apps = set()
+        fields = list(dict.fromkeys([*SNAPSHOT_FIELDS, *STATE_FIELDS]))
+        for row_key, entity in self.load_snapshot(fields).items():
+            app_id = entity.get("AppID")
+            if not app_id:
+                continue
+            # A projected property the entity lacks comes back as null, or not at all
+            missing = {field: "" for field in STATE_FIELDS if entity.get(field) is None}
+            if missing:
+                self.queue_patch(row_key, missing)
+            apps.add(app_id.strip())
+        return apps
+
+    def get_state(self, row_key):
+        """Return the snapshot entry for `row_key`, or an empty dict."""
+        return self.snapshot.get(row_key, {})
+
+    def get_sha(self, row_key):
+        return self.get_state(row_key).get("gitsha") or None
+
+    def queue_patch(self, row_key, patch):
+        """Buffer a merge of `patch` into the entity identified by `row_key`."""
+        with self._lock:
+            self._pending.setdefault(row_key, {}).update(patch)
+            self.snapshot.setdefault(row_key, {}).update(patch)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def update_entity(self, app_id, version=None, blob_path=None, github_path=None, hash_value=None, git_sha=None):
+        """Queue an update of the given fields, mirroring the scripts' update_entity."""
+        patch = {}
+        if version:
+            patch["version"] = version
+        if blob_path:
+            patch["Blobpath"] = blob_path
+        if github_path:
+            patch["githubpath"] = github_path
+        if hash_value:
+            patch["hash"] = hash_value
+        if git_sha:
+            patch["gitsha"] = git_sha
+        if patch:
+            self.queue_patch(app_id, patch)
+
+    def _operation(self, row_key, patch):
+        entity = {"PartitionKey": self.partition_key, "RowKey": row_key, **patch}
+        etag = self._etags.get(row_key)
+        if etag:
+            return ("update", entity, {"mode": UpdateMode.MERGE, "etag": etag,
+                                       "match_condition": MatchConditions.IfNotModified})
+        return ("upsert", entity, {"mode": UpdateMode.MERGE})
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval / 2):
+            if not self._pending or time.monotonic() - self._last_flush < self.flush_interval:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                # The patches are back in the buffer; retried on the next tick
+                print(f"\033[31mBackground Table flush failed: {e}\033[0m")
+
+    def _requeue(self, pending):
+        # Anything patched since goes on top of the unsent patches
+        for row_key, patch in self._pending.items():
+            pending.setdefault(row_key, {}).update(patch)
+        self._pending = pending
+
+    def flush(self):
+        """Submit all buffered patches, at most `batch_size` per transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            row_keys = list(pending)
+            for start in range(0, len(row_keys), self.batch_size):
+                chunk = row_keys[start:start + self.batch_size]
+                operations = [self._operation(row_key, pending[row_key]) for row_key in chunk]
+                try:
+                    results = self.table_client.submit_transaction(operations)
+                    for row_key, result in zip(chunk, results):
+                        self._etags[row_key] = result.get("etag")
+                    print(f"\033[32mCommitted {len(operations)} entity update(s) in one transaction.\033[0m")
+                except TableTransactionError as e:
+                    # The whole transaction is rolled back; resolve entity by entity
+                    print(f"\033[33mTransaction failed, reapplying {len(operations)} update(s) one by one: {e}\033[0m")
+                    for row_key in chunk:
+                        self._apply_with_retry(row_key, pending[row_key])
+                except Exception:
+                    self._requeue({row_key: pending[row_key] for row_key in row_keys[start:]})
+                    raise
+
+    def _apply_with_retry(self, row_key, patch):
+        for _ in range(CONFLICT_RETRIES):
+            verb, entity, kwargs = self._operation(row_key, patch)
+            try:
+                if verb == "update":
+                    result = self.table_client.update_entity(entity=entity, **kwargs)
+                else:
+                    result = self.table_client.upsert_entity(entity=entity, **kwargs)
+                self._etags[row_key] = result.get("etag")
+                return True
+            except ResourceModifiedError:
+                current = self.table_client.get_entity(partition_key=self.partition_key, row_key=row_key)
+                self._etags[row_key] = current.metadata.get("etag")
+                self.snapshot[row_key] = {**dict(current), **patch}
+                print(f"\033[33mETag conflict for AppID: {row_key}, reapplying update.\033[0m")
+            except ResourceNotFoundError:
+                # Deleted by someone else since the snapshot; recreate it
+                self._etags.pop(row_key, None)
+            except Exception as e:
+                print(f"\033[31mError updating entity for AppID: {row_key}: {e}\033[0m")
+                return False
+        print(f"\033[31mGave up updating AppID: {row_key} after {CONFLICT_RETRIES} conflicts.\033[0m")
+        return False
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            self.table_client.close()
@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import re
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePosixPath
+from dotenv import load_dotenv
+from pipeline import parse_update
+from update_on_single import parse_removal
+load_dotenv()
+
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# A burst of deliveries is collected until it has been quiet this many
+# seconds, but never held longer than WEBHOOK_MAX_DELAY
+DEBOUNCE = float(os.getenv("WEBHOOK_DEBOUNCE", "5"))
+MAX_DELAY = float(os.getenv("WEBHOOK_MAX_DELAY", "60"))
+# GitHub caps webhook payloads at 25 MB
+MAX_BODY = 25 * 1024 * 1024
+
+WINGET_REPO = "microsoft/winget-pkgs"
+CASK_REPO = "Homebrew/homebrew-cask"
+FORMULA_REPO = "Homebrew/homebrew-core"
+
+# manifests/<letter>/<Publisher>/<Package...>/<version>[/<file>.yaml]
+WINGET_PATH = re.compile(r"manifests/\w/(\S+)")
+PR_TITLE_PREFIXES = ("new version", "update", "modify")
+# Homebrew PR titles lead with the token: "firefox 121.0", "wget: update 1.24.5 bottle."
+HOMEBREW_PR_TITLE = re.compile(r"([a-z0-9][\w@+.-]*?):?\s")
+
+
+def verify_signature(secret, body, signature):
+    """Check an X-Hub-Signature-256 header ("sha256=<hex>") against the raw body."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def winget_app_id(path):
+    """App ID for a path (or PR title) under manifests/, or None.
+
+    manifests/m/Mica/Mica/1.3.1.2/Mica.Mica.yaml and the bare version
+    directory manifests/m/Mica/Mica/1.3.1.2 both give Mica.Mica.
+    """
+    match = WINGET_PATH.search(path.replace("\\", "/"))
+    if not match:
+        return None
+    parts = match.group(1).strip("/").split("/")
+    if parts[-1].endswith(".yaml"):
+        parts.pop()
+    # Drop the version directory
+    return ".".join(parts[:-1]) or None
+
+
+def homebrew_token(path, folder):
+    """Token for Casks/<x>/<token>.rb (or the flat Casks/<token>.rb), or None."""
+    path = PurePosixPath(path)
+    if path.parts[:1] != (folder,) or path.suffix != ".rb":
+        return None
+    return path.stem
+
+
+def pr_app_id(title):
+    """App ID a merged winget-pkgs update PR touched, from its title, or None."""
+    app_id = winget_app_id(title)
+    if not app_id and title.lower().startswith("automatic update of "):
+        app_id = title.split()[3] if len(title.split()) > 3 else None
+    elif not app_id and title.lower().startswith(PR_TITLE_PREFIXES):
+        app_id = parse_update(title)[0]
+    return app_id
+
+
+def homebrew_pr_token(title):
+    """Token a merged Homebrew PR touched, from its title, or None."""
+    match = HOMEBREW_PR_TITLE.match(title)
+    return match.group(1) if match else None
+
+
+def changed_targets(event, payload):
+    """{source: set of app IDs/tokens} changed by one push or pull_request delivery.
+
+    Sources are "winget" (winget package IDs), "winget-removals" ((app ID,
+    version) pairs from merged removal PRs), "homebrew-api" (cask and formula
+    tokens) and "homebrew-casks" (cask tokens). Pushes use the commits'
+    added/modified/removed paths; merged PRs use the title, as
+    update_on_single.py does, since PR payloads carry no file list.
+    """
+    repository = payload.get("repository") or {}
+    repo = repository.get("full_name", "")
+    targets = {}
+    if event == "push":
+        # Only pushes to the default branch; not tags, nor branches merely named like it
+        branches = {repository["default_branch"]} if repository.get("default_branch") else {"master", "main"}
+        if payload.get("ref") not in {f"refs/heads/{branch}" for branch in branches}:
+            return targets
+        paths = {path for commit in payload.get("commits", [])
+                 for key in ("added", "modified", "removed") for path in commit.get(key, [])}
+        if repo == WINGET_REPO:
+            targets["winget"] = {app_id for app_id in map(winget_app_id, paths) if app_id}
+        elif repo == CASK_REPO:
+            tokens = {token for token in (homebrew_token(path, "Casks") for path in paths) if token}
+            targets["homebrew-api"] = targets["homebrew-casks"] = tokens
+        elif repo == FORMULA_REPO:
+            targets["homebrew-api"] = {token for token in (homebrew_token(path, "Formula") for path in paths) if token}
+    elif event == "pull_request":
+        pr = payload.get("pull_request") or {}
+        if payload.get("action") != "closed" or not pr.get("merged_at"):
+            return targets
+        title = pr.get("title") or ""
+        if repo == WINGET_REPO:
+            removal = parse_removal(title)
+            if removal:
+                targets["winget-removals"] = {removal}
+            else:
+                targets["winget"] = {pr_app_id(title)} - {None}
+        elif repo == CASK_REPO:
+            targets["homebrew-api"] = targets["homebrew-casks"] = {homebrew_pr_token(title)} - {None}
+        elif repo == FORMULA_REPO:
+            targets["homebrew-api"] = {homebrew_pr_token(title)} - {None}
+    return {source: found for source, found in targets.items() if found}
+
+
+def load_replay(file_path):
+    """(event, payload) pairs from a recorded file.
+
+    Accepts a list of PR objects as saved by update_on_single.py
+    (recent_merged_prs.json), a list of {"event", "payload"} records, or a
+    single payload.
+    """
+    data = json.loads(Path(file_path).read_text())
+    for item in data if isinstance(data, list) else [data]:
+        if "event" in item and "payload" in item:
+            yield item["event"], item["payload"]
+        elif "commits" in item:
+            yield "push", item
+        elif "pull_request" in item:
+            yield "pull_request", item
+        elif "merged_at" in item:
+            yield "pull_request", {"action": "closed", "pull_request": item,
+                                   "repository": item.get("base", {}).get("repo", {})}
+
+
+class Debouncer:
+    """Collects changed targets and hands them to `callback` in one batch.
+
+    The batch is released once no delivery has arrived for `delay` seconds,
+    or `max_delay` after its first delivery, so a stream of merges still
+    flows. The callback runs on the debouncer's own thread.
+    """
+
+    def __init__(self, callback, delay=DEBOUNCE, max_delay=MAX_DELAY):
+        self.callback = callback
+        self.delay = delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self._first = self._last = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="webhook-debounce", daemon=True)
+        self._thread.start()
+
+    def add(self, targets):
+        if not targets:
+            return
+        with self._cond:
+            for source, found in targets.items():
+                self.pending.setdefault(source, set()).update(found)
+            now = time.monotonic()
+            self._first = self._first or now
+            self._last = now
+            self._cond.notify()
+
+    def _take(self):
+        batch, self.pending = self.pending, {}
+        self._first = self._last = None
+        return batch
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._first is None:
+                        self._cond.wait()
+                        continue
+                    due = min(self._last + self.delay, self._first + self.max_delay)
+                    if time.monotonic() >= due:
+                        break
+                    self._cond.wait(due - time.monotonic())
+                batch = self._take()
+                stopped = self._stopped
+            if batch:
+                try:
+                    self.callback(batch)
+                except Exception as e:
+                    print(f"\033[31mWebhook batch failed: {e}\033[0m")
+            if stopped:
+                return
+
+    def close(self):
+        """Release whatever is pending now and stop the thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+
+def describe(found):
+    """Printable, sorted form of a target set; removals are (app ID, version) pairs."""
+    return sorted(" ".join(item) if isinstance(item, tuple) else item for item in found)
+
+
+class WebhookDispatcher:
+    """Runs debounced batches through a warm UpdateService, tracked apps only.
+
+    Removals go to UpdateService.remove, everything else through the engine.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    def __call__(self, batch):
+        for kind, app_ids in batch.items():
+            if kind == "winget-removals":
+                removals = {}
+                for app_id, version in app_ids:
+                    removals.setdefault(app_id, set()).add(version)
+                self.service.remove(removals)
+                continue
+            source, targets = self.service.source_for(kind, app_ids)
+            if targets:
+                self.service.run(source, targets)
+
+
+def make_handler(secret, debouncer):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body=None):
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            # A negative length would make rfile.read() wait for the client to close
+            if length < 0:
+                return self._reply(400, {"error": "invalid Content-Length"})
+            if length > MAX_BODY:
+                return self._reply(413, {"error": "payload too large"})
+            body = self.rfile.read(length)
+            if secret and not verify_signature(secret, body, self.headers.get("X-Hub-Signature-256")):
+                return self._reply(401, {"error": "bad signature"})
+            event = self.headers.get("X-GitHub-Event", "")
+            if event == "ping":
+                return self._reply(200, {"ok": True})
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return self._reply(400, {"error": "invalid JSON"})
+            targets = changed_targets(event, payload)
+            debouncer.add(targets)
+            self._reply(202, {source: describe(found) for source, found in targets.items()})
+
+        def log_message(self, format, *args):
+            print(f"\033[90m{self.address_string()} {format % args}\033[0m")
+
+    return WebhookHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive GitHub webhooks and push changed apps through the pipelines.")
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE, help="Quiet seconds before a batch runs")
+    parser.add_argument("--replay", help="Process recorded payloads (e.g. recent_merged_prs.json) and exit")
+    parser.add_argument("--dry-run", action="store_true", help="Print the changed targets instead of updating")
+    parser.add_argument("--insecure", action="store_true", help="Accept unsigned deliveries (no GITHUB_WEBHOOK_SECRET)")
+    args = parser.parse_args()
+
+    if args.replay:
+        targets = {}
+        for event, payload in load_replay(args.replay):
+            for source, found in changed_targets(event, payload).items():
+                targets.setdefault(source, set()).update(found)
+        for source, found in targets.items():
+            print(f"\033[36m{source}: {len(found)} target(s)\033[0m {', '.join(describe(found))}")
+        if not args.dry_run:
+            from service import UpdateService
+            with UpdateService() as service:
+                WebhookDispatcher(service)(targets)
+        return
+
+    if not WEBHOOK_SECRET and not args.insecure:
+        parser.error("GITHUB_WEBHOOK_SECRET is not set (pass --insecure to accept unsigned deliveries)")
+
+    if args.dry_run:
+        service, callback = None, lambda batch: print(f"\033[36mBatch: {batch}\033[0m")
+    else:
+        from service import UpdateService
+        service = UpdateService()
+        callback = WebhookDispatcher(service)
+    debouncer = Debouncer(callback, args.debounce)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(WEBHOOK_SECRET, debouncer))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"\033[32mListening for webhooks on {args.host}:{args.port}\033[0m")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        debouncer.close()
+        if service is not None:
+            service.close()
+
+
+if __name__ == "__main__":
+    main()